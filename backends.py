@@ -0,0 +1,799 @@
+"""
+Image engine registry for the converter.
+
+Maps a probed still-image format to an ordered list of engines that can
+decode it: the ffmpeg CLI, ImageMagick and (when installed) Pillow
+in-process. Decoding happens once, at reduced resolution where the codec
+allows it, into a small PPM that the JPEG quality passes then re-encode
+with the best available encoder (mozjpeg cjpeg, Pillow, ImageMagick,
+ffmpeg in that order). Capabilities are probed once, when this module is
+imported. The order comes from backend_ranking.json, written by the bundled
+benchmark and checked in: it is measured once on an x86_64 host with the
+layer's ffmpeg and Pillow, not on Lambda, so it is static until re-run.
+Formats it does not cover use the defaults below:
+
+    python backends.py benchmark [--samples DIR] [--repeat N] [--out FILE]
+    python backends.py compare [--samples DIR] [--quality Q]
+"""
+
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+import io
+import os
+import sys
+import re
+import json
+import shutil
+import logging
+import platform
+import statistics
+import subprocess
+import tempfile
+
+import processes
+import raw_preview
+import runtime
+
+try:
+	from PIL import Image, ImageChops
+except ImportError:
+	Image = None
+
+ImageCms = None
+if Image is not None:
+	try:
+		from pillow_heif import register_heif_opener
+		register_heif_opener()
+	except ImportError:
+		pass
+	try:
+		# Needs Pillow built with littlecms (the manylinux wheels are)
+		from PIL import ImageCms
+		_SRGB = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB"))
+	except ImportError:
+		ImageCms = None
+	# Uploads are public: keep Pillow's decompression-bomb guard, raised from
+	# its default so large uncompressed rasters can still be read in bands
+	# (Pillow refuses to open twice this many pixels)
+	Image.MAX_IMAGE_PIXELS = 1_000_000_000
+
+logger = logging.getLogger(__name__)
+
+RANKING_PATH = os.environ.get("BACKEND_RANKING", os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend_ranking.json"))
+
+DEFAULT_ORDER = ["ffmpeg", "pillow", "imagemagick"]
+FORMAT_ORDER = {
+	# Pillow can decode uncompressed rasters a band at a time
+	"bmp": ["pillow", "ffmpeg", "imagemagick"],
+	"tiff": ["pillow", "ffmpeg", "imagemagick"],
+	"heic": ["imagemagick", "pillow", "ffmpeg"],
+	"avif": ["pillow", "imagemagick", "ffmpeg"],
+	"jxl": ["pillow", "imagemagick", "ffmpeg"],
+	"psd": ["imagemagick", "pillow", "ffmpeg"],
+}
+
+_EXTENSION_FORMATS = {
+	".jpg": "jpeg", ".jpeg": "jpeg", ".png": "png", ".gif": "gif", ".bmp": "bmp",
+	".webp": "webp", ".tif": "tiff", ".tiff": "tiff", ".ico": "ico", ".psd": "psd",
+	".jxl": "jxl", ".avif": "avif", ".heic": "heic", ".heif": "heic", ".ppm": "ppm",
+}
+
+_HEIF_BRANDS = {b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis", b"mif1", b"msf1"}
+
+# EXIF orientation -> ffmpeg filter that brings the pixels upright
+_ORIENTATION_FILTERS = {
+	2: "hflip",
+	3: "hflip,vflip",
+	4: "vflip",
+	5: "transpose=0",
+	6: "transpose=1",
+	7: "transpose=3",
+	8: "transpose=2",
+}
+
+_ORIENTATION_MAGICK = {
+	2: ["-flop"],
+	3: ["-rotate", "180"],
+	4: ["-flip"],
+	5: ["-transpose"],
+	6: ["-rotate", "90"],
+	7: ["-transverse"],
+	8: ["-rotate", "270"],
+}
+
+# Orientations that swap width and height
+_ROTATES_90 = {5, 6, 7, 8}
+
+# Same mapping as PIL.ImageOps.exif_transpose (Image.Transpose values)
+_ORIENTATION_PILLOW = {2: 0, 3: 3, 4: 1, 5: 5, 6: 4, 7: 6, 8: 2}
+
+_FFMPEG_DECODERS = {
+	"jpeg": {"mjpeg"},
+	"png": {"png"},
+	"gif": {"gif"},
+	"bmp": {"bmp"},
+	"webp": {"webp", "libwebp"},
+	"tiff": {"tiff"},
+	"psd": {"psd"},
+	"jxl": {"libjxl"},
+	"avif": {"libdav1d", "libaom-av1", "av1"},
+	"heic": {"hevc"},
+	"ppm": {"ppm"},
+}
+
+_PILLOW_FORMATS = {
+	"jpeg": "JPEG", "png": "PNG", "gif": "GIF", "bmp": "BMP", "webp": "WEBP",
+	"tiff": "TIFF", "ico": "ICO", "psd": "PSD", "jxl": "JXL", "avif": "AVIF", "heic": "HEIF",
+	"ppm": "PPM",
+}
+
+# Largest image Pillow decodes whole (~750 MB as RGB); bigger ones must be
+# banded or are left to another engine
+_FULL_DECODE_PIXELS = 250_000_000
+# Bytes of source rows held in memory at once by the banded decode
+_BAND_BYTES = 16 * 1024 * 1024
+_RAW_PIXEL_BYTES = {"L": 1, "RGB": 3, "BGR": 3, "RGBA": 4, "RGBX": 4, "BGRA": 4, "BGRX": 4}
+
+###############################################################################
+
+def _run(cmd: list[str]):
+	return processes.run(cmd, check=True)
+
+###############################################################################
+
+def probe_format(path: str) -> str:
+	"""
+	Identify a still-image container from its magic bytes, falling back to the
+	file extension. Returns "unknown" when neither is recognised.
+	"""
+	with open(path, "rb") as f:
+		head = f.read(64)
+	if head.startswith(b"\xff\xd8\xff"):
+		return "jpeg"
+	if head.startswith(b"\x89PNG\r\n\x1a\n"):
+		return "png"
+	if head[:4] in (b"GIF8",):
+		return "gif"
+	if head.startswith(b"P6"):
+		return "ppm"
+	if head.startswith(b"BM"):
+		return "bmp"
+	if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+		return "webp"
+	if head[:4] in (b"II*\x00", b"MM\x00*"):
+		return "tiff"
+	if head[:4] == b"\x00\x00\x01\x00":
+		return "ico"
+	if head[:4] == b"8BPS":
+		return "psd"
+	if head.startswith(b"\xff\x0a") or head.startswith(b"\x00\x00\x00\x0cJXL \r\n\x87\n"):
+		return "jxl"
+	if head[4:8] == b"ftyp":
+		box_size = int.from_bytes(head[:4], "big")
+		brands = [head[i:i + 4] for i in range(8, min(box_size, len(head)), 4)]
+		if b"avif" in brands or b"avis" in brands:
+			return "avif"
+		if _HEIF_BRANDS.intersection(brands):
+			return "heic"
+	return _EXTENSION_FORMATS.get(os.path.splitext(path)[1].lower(), "unknown")
+
+def _jpeg_size(path: str) -> tuple[int, int] | None:
+	reader = raw_preview.BlockReader(raw_preview.file_reader(path))
+	return raw_preview.jpeg_dimensions(reader, 0, os.path.getsize(path))
+
+###############################################################################
+
+def _ffmpeg_filter(max_width: int, orientation: int) -> str:
+	scale = f"scale='min({max_width},iw)':-2"
+	rotate = _ORIENTATION_FILTERS.get(orientation)
+	return f"{rotate},{scale}" if rotate else scale
+
+###############################################################################
+
+def _banded_tiles(im) -> tuple[str, int, list[tuple[int, int, int, int]]] | None:
+	"""
+	Row layout of an uncompressed, full-width striped image (BMP, raw TIFF) as
+	(rawmode, stride, strips), strips being (y0, y1, offset, direction) tuples
+	sorted by y0, or None when banding is not possible.
+	"""
+	if im.mode not in ("RGB", "RGBA", "L") or not getattr(im, "filename", None) or not im.tile:
+		return None
+	layout = []
+	rawmode = stride = None
+	for codec, box, offset, args in im.tile:
+		if codec != "raw" or box[0] != 0 or box[2] != im.width or not isinstance(args, tuple) or len(args) < 2:
+			return None
+		row_bytes = args[1] or im.width * _RAW_PIXEL_BYTES.get(args[0], 0)
+		if not row_bytes or (rawmode is not None and (args[0], row_bytes) != (rawmode, stride)):
+			return None
+		rawmode, stride = args[0], row_bytes
+		direction = args[2] if len(args) > 2 else 1
+		layout.append((box[1], box[3], offset, direction))
+	layout.sort()
+	return rawmode, stride, layout
+
+###############################################################################
+
+def _check_full_decode(im):
+	if im.width * im.height > _FULL_DECODE_PIXELS:
+		raise ValueError(f"{im.width}x{im.height} is too large for a whole-image Pillow decode")
+
+
+def _banded_reduce(im, factor: int):
+	"""
+	Box-reduce an uncompressed striped image by `factor`, reading one band of
+	rows at a time so only the band and the reduced output are in memory.
+	"""
+	rawmode, stride, layout = _banded_tiles(im)
+	width, height = im.size
+	out = Image.new(im.mode, (-(-width // factor), -(-height // factor)))
+	band_rows = factor * max(1, _BAND_BYTES // (stride * factor))
+	tile_index = 0
+	with open(im.filename, "rb") as f:
+		for top in range(0, height, band_rows):
+			rows = min(band_rows, height - top)
+			data = bytearray()
+			for r in range(top, top + rows):
+				while layout[tile_index][1] <= r:
+					tile_index += 1
+				y0, y1, offset, direction = layout[tile_index]
+				f.seek(offset + ((r - y0) if direction > 0 else (y1 - 1 - r)) * stride)
+				data += f.read(stride)
+			band = Image.frombuffer(im.mode, (width, rows), bytes(data), "raw", rawmode, stride, 1)
+			out.paste(band.reduce(factor), (0, top // factor))
+	return out
+
+###############################################################################
+
+class Engine:
+	name = ""
+
+	def __init__(self):
+		# Probed once, when the registry below is built at import
+		self.formats: frozenset[str] = self._probe_formats() if self.available() else frozenset()
+
+	def available(self) -> bool:
+		raise NotImplementedError
+
+	def _probe_formats(self) -> frozenset[str]:
+		return frozenset()
+
+	def decodes(self, fmt: str) -> bool:
+		return self.available() and fmt in self.formats
+
+	def decode_scaled(self, src: str, dst: str, max_width: int, orientation: int = 1, fmt: str = "unknown"):
+		"""
+		Decode `src` at no more than `max_width` (upright) into a PPM at `dst`,
+		using reduced-resolution decoding where the codec allows it.
+		"""
+		raise NotImplementedError
+
+	def write_sample(self, src: str, dst: str):
+		"""Transcode `src` into the format implied by the `dst` extension."""
+		raise NotImplementedError
+
+###############################################################################
+
+class FfmpegEngine(Engine):
+	name = "ffmpeg"
+
+	def __init__(self):
+		self.binary = shutil.which("ffmpeg")
+		super().__init__()
+
+	def available(self) -> bool:
+		return self.binary is not None
+
+	def _probe_formats(self) -> frozenset[str]:
+		res = subprocess.run(["ffmpeg", "-hide_banner", "-decoders"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=False)
+		decoders = set()
+		for line in res.stdout.decode(errors="replace").splitlines():
+			parts = line.split()
+			if len(parts) >= 2 and len(parts[0]) == 6 and parts[0][0] in "VAS":
+				decoders.add(parts[1])
+		return frozenset(fmt for fmt, names in _FFMPEG_DECODERS.items() if names & decoders)
+
+	def decode_scaled(self, src: str, dst: str, max_width: int, orientation: int = 1, fmt: str = "unknown"):
+		lowres = []
+		size = _jpeg_size(src) if fmt == "jpeg" else None
+		if size:
+			# mjpeg can decode at 1/2, 1/4 or 1/8 scale straight from the DCT
+			out_width = size[1] if orientation in _ROTATES_90 else size[0]
+			shift = 0
+			while shift < 3 and (out_width >> (shift + 1)) >= max_width:
+				shift += 1
+			if shift:
+				lowres = ["-lowres", str(shift)]
+		# Orientation is applied explicitly, so keep ffmpeg from rotating as well
+		_run(["ffmpeg", "-y", "-noautorotate", *lowres, "-i", src, "-vf", _ffmpeg_filter(max_width, orientation), "-frames:v", "1", "-pix_fmt", "rgb24", dst])
+
+	def write_sample(self, src: str, dst: str):
+		_run(["ffmpeg", "-y", "-i", src, "-frames:v", "1", dst])
+
+###############################################################################
+
+class ImageMagickEngine(Engine):
+	name = "imagemagick"
+
+	def __init__(self):
+		# IM7 ships `magick`; IM6 layers only have `convert`
+		self.binary = shutil.which("magick") or shutil.which("convert")
+		super().__init__()
+
+	def available(self) -> bool:
+		return self.binary is not None
+
+	def _probe_formats(self) -> frozenset[str]:
+		res = subprocess.run([self.binary, "-list", "format"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=False)
+		readable = set()
+		for line in res.stdout.decode(errors="replace").splitlines():
+			parts = line.split()
+			if len(parts) < 2:
+				continue
+			mode = next((p for p in parts[1:3] if len(p) == 3 and p[0] in "r-" and p[1] in "w-"), None)
+			if mode and mode[0] == "r":
+				readable.add(parts[0].rstrip("*").upper())
+		return frozenset(fmt for fmt in set(_EXTENSION_FORMATS.values()) if fmt.upper() in readable or (fmt == "heic" and "HEIF" in readable))
+
+	def decode_scaled(self, src: str, dst: str, max_width: int, orientation: int = 1, fmt: str = "unknown"):
+		# Cap the pixel cache so oversized rasters spill to disk instead of RAM
+		cmd = [self.binary, "-limit", "memory", "256MiB", "-limit", "map", "512MiB"]
+		if fmt == "jpeg":
+			cmd += ["-define", f"jpeg:size={max_width}x{max_width}"]
+		cmd += [f"{src}[0]"]
+		cmd += _ORIENTATION_MAGICK.get(orientation, [])
+		cmd += ["-resize", f"{max_width}x>", "-depth", "8", dst]
+		_run(cmd)
+
+	def write_sample(self, src: str, dst: str):
+		_run([self.binary, f"{src}[0]", dst])
+
+###############################################################################
+
+class PillowEngine(Engine):
+	name = "pillow"
+
+	def available(self) -> bool:
+		return Image is not None
+
+	def _probe_formats(self) -> frozenset[str]:
+		Image.init()
+		known = set(Image.OPEN)
+		return frozenset(fmt for fmt, pil in _PILLOW_FORMATS.items() if pil in known)
+
+	def decode_scaled(self, src: str, dst: str, max_width: int, orientation: int = 1, fmt: str = "unknown"):
+		with Image.open(src) as im:
+			out_width = im.height if orientation in _ROTATES_90 else im.width
+			factor = max(1, out_width // max_width)
+			if factor > 1 and im.format == "JPEG":
+				# DCT scaling: libjpeg decodes at 1/2, 1/4 or 1/8 directly
+				im.draft("RGB", (im.width // factor, im.height // factor))
+				_check_full_decode(im)
+				scaled = im.convert("RGB")
+			elif factor > 1 and _banded_tiles(im):
+				scaled = _banded_reduce(im, factor).convert("RGB")
+			else:
+				# Compressed or unbandable: the whole image is decoded, so it must fit the budget
+				_check_full_decode(im)
+				im.seek(0)
+				scaled = im.convert("RGB")
+				if factor > 1:
+					scaled = scaled.reduce(factor)
+		if orientation in _ORIENTATION_PILLOW:
+			scaled = scaled.transpose(_ORIENTATION_PILLOW[orientation])
+		if scaled.width > max_width:
+			height = max(2, round(scaled.height * max_width / scaled.width / 2) * 2)
+			scaled = scaled.resize((max_width, height), Image.LANCZOS)
+		scaled.save(dst, "PPM")
+
+	def write_sample(self, src: str, dst: str):
+		with Image.open(src) as im:
+			im.save(dst)
+
+###############################################################################
+
+class Encoder:
+	"""
+	Writes the final JPEG from a PPM intermediate. Every encoder uses optimized
+	Huffman tables and progressive scans where it can; the PPM carries no
+	EXIF/ICC data and is already upright, so the output is metadata-free.
+	"""
+	name = ""
+	# Quality of the first pass at the default 5 MB budget. The scales differ:
+	# libjpeg's 65 matches the legacy first pass (ffmpeg -qscale:v 7) in luma
+	# SSIM on tests/corpus with 94% of its bytes
+	first_quality = 65
+
+	def available(self) -> bool:
+		raise NotImplementedError
+
+	def encode(self, src: str, dst: str, quality: int, subsampling: str = "4:2:0"):
+		raise NotImplementedError
+
+###############################################################################
+
+class CjpegEncoder(Encoder):
+	name = "cjpeg"
+
+	def __init__(self):
+		self.binary = shutil.which("cjpeg")
+
+	def available(self) -> bool:
+		return self.binary is not None
+
+	def encode(self, src: str, dst: str, quality: int, subsampling: str = "4:2:0"):
+		sample = "1x1" if subsampling == "4:4:4" else "2x2"
+		_run([self.binary, "-quality", str(quality), "-optimize", "-progressive", "-sample", sample, "-outfile", dst, src])
+
+###############################################################################
+
+class PillowEncoder(Encoder):
+	name = "pillow"
+
+	def available(self) -> bool:
+		return Image is not None
+
+	def encode(self, src: str, dst: str, quality: int, subsampling: str = "4:2:0"):
+		with Image.open(src) as im:
+			im.convert("RGB").save(dst, "JPEG", quality=quality, optimize=True, progressive=True,
+				subsampling=0 if subsampling == "4:4:4" else 2)
+
+###############################################################################
+
+class ImageMagickEncoder(Encoder):
+	name = "imagemagick"
+
+	def available(self) -> bool:
+		return ENGINES["imagemagick"].available()
+
+	def encode(self, src: str, dst: str, quality: int, subsampling: str = "4:2:0"):
+		_run([ENGINES["imagemagick"].binary, src, "-strip", "-sampling-factor", subsampling, "-interlace", "JPEG",
+			"-define", "jpeg:optimize-coding=true", "-quality", str(quality), dst])
+
+###############################################################################
+
+class FfmpegEncoder(Encoder):
+	name = "ffmpeg"
+	# Maps to -qscale:v 7, the legacy first pass
+	first_quality = 85
+
+	def available(self) -> bool:
+		return ENGINES["ffmpeg"].available()
+
+	def encode(self, src: str, dst: str, quality: int, subsampling: str = "4:2:0"):
+		# mjpeg has no progressive mode; optimal Huffman tables only
+		pix_fmt = "yuvj444p" if subsampling == "4:4:4" else "yuvj420p"
+		_run(["ffmpeg", "-y", "-i", src, "-pix_fmt", pix_fmt, "-huffman", "optimal",
+			"-qscale:v", str(int((100 - quality) / 2) or 1), "-frames:v", "1", dst])
+
+###############################################################################
+
+ENGINES: dict[str, Engine] = {e.name: e for e in (FfmpegEngine(), ImageMagickEngine(), PillowEngine())}
+ENCODERS: list[Encoder] = [CjpegEncoder(), PillowEncoder(), ImageMagickEncoder(), FfmpegEncoder()]
+
+_ranking: dict[str, list[str]] | None = None
+
+
+def _load_ranking() -> dict[str, list[str]]:
+	global _ranking
+	if _ranking is None:
+		try:
+			with open(RANKING_PATH) as f:
+				_ranking = json.load(f).get("ranking", {})
+		except (OSError, ValueError):
+			logger.warning(f"No engine ranking at {RANKING_PATH}, using the default order")
+			_ranking = {}
+	return _ranking
+
+###############################################################################
+
+def engines_for(fmt: str) -> list[Engine]:
+	"""
+	Engines able to decode `fmt`, fastest first. Unknown formats get every
+	available engine so each can attempt it; ffmpeg is the last resort.
+	"""
+	order = _load_ranking().get(fmt) or FORMAT_ORDER.get(fmt, DEFAULT_ORDER)
+	order = order + [name for name in DEFAULT_ORDER if name not in order]
+	if fmt == "unknown":
+		engines = [ENGINES[name] for name in order if ENGINES[name].available()]
+	else:
+		engines = [ENGINES[name] for name in order if ENGINES[name].decodes(fmt)]
+	return engines or [ENGINES["ffmpeg"]]
+
+###############################################################################
+
+def decode_scaled(src: str, dst: str, max_width: int, orientation: int = 1, fmt: str | None = None) -> Engine:
+	"""
+	Decode `src` into a PPM of at most `max_width` with the first engine that
+	succeeds, and return that engine.
+	"""
+	fmt = fmt or probe_format(src)
+	engines = engines_for(fmt)
+	for engine in engines:
+		# A cancelled job stops here rather than moving on to the next engine
+		if processes.poll_hook:
+			processes.poll_hook()
+		try:
+			engine.decode_scaled(src, dst, max_width, orientation, fmt)
+			_convert_to_srgb(src, dst)
+			return engine
+		except (subprocess.CalledProcessError, OSError, ValueError) as e:
+			# Decoder failures only; cancellation and other errors propagate
+			if engine is engines[-1]:
+				raise
+			logger.warning(f"Engine {engine.name} failed to decode {fmt}: {e}")
+
+###############################################################################
+
+def _convert_to_srgb(src: str, ppm: str):
+	"""
+	Bring the decoded PPM into sRGB when `src` embeds another RGB profile
+	(Display P3 phone photos, Adobe RGB). The PPM and the JPEG made from it
+	carry no profile, so viewers would read the pixels as sRGB.
+	"""
+	if ImageCms is None:
+		return
+	try:
+		with Image.open(src) as im:
+			icc = im.info.get("icc_profile")
+	except Exception:
+		return
+	if not icc:
+		return
+	try:
+		profile = ImageCms.ImageCmsProfile(io.BytesIO(icc))
+		if profile.profile.xcolor_space.strip() != "RGB" or "srgb" in ImageCms.getProfileDescription(profile).lower():
+			return
+		with Image.open(ppm) as im:
+			converted = ImageCms.profileToProfile(im, profile, _SRGB, outputMode="RGB")
+		converted.save(ppm, "PPM")
+		logger.info(f"Converted colours from {ImageCms.getProfileDescription(profile).strip()} to sRGB")
+	except (ImageCms.PyCMSError, OSError, ValueError) as e:
+		logger.warning(f"Could not apply the embedded ICC profile: {e}")
+
+###############################################################################
+
+def jpeg_encoder() -> Encoder:
+	return next((e for e in ENCODERS if e.available()), ENCODERS[-1])
+
+###############################################################################
+
+def source_orientation(path: str, fmt: str) -> int:
+	if fmt != "jpeg":
+		return 1
+	return raw_preview.jpeg_orientation(raw_preview.file_reader(path))
+
+###############################################################################
+
+def chroma_subsampling(path: str) -> str:
+	"""
+	Pick 4:4:4 for images with fine colour detail (screenshots, graphics, text)
+	where 4:2:0 visibly smears edges, and 4:2:0 for everything else.
+	"""
+	if Image is None:
+		return "4:2:0"
+	with Image.open(path) as im:
+		_, cb, cr = im.convert("YCbCr").split()
+	total = cb.width * cb.height
+	for channel in (cb, cr):
+		halved = channel.reduce(2).resize(channel.size, Image.BILINEAR)
+		hist = ImageChops.difference(channel, halved).histogram()
+		if sum(hist[24:]) > total * 0.01:
+			return "4:4:4"
+	return "4:2:0"
+
+###############################################################################
+
+def capabilities() -> dict[str, list[str]]:
+	caps = {name: sorted(engine.formats) for name, engine in ENGINES.items() if engine.available()}
+	caps["jpeg_encoders"] = [e.name for e in ENCODERS if e.available()]
+	return caps
+
+###############################################################################
+
+def _make_samples(work_dir: str) -> dict[str, str]:
+	"""
+	Synthesise one 4000x3000 sample per format using whichever engine can
+	write it.
+	"""
+	base = os.path.join(work_dir, "base.png")
+	if ENGINES["ffmpeg"].available():
+		_run(["ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc2=size=4000x3000:rate=1", "-frames:v", "1", base])
+	elif ENGINES["imagemagick"].available():
+		_run([ENGINES["imagemagick"].binary, "-size", "4000x3000", "plasma:", base])
+	elif Image is not None:
+		Image.effect_mandelbrot((4000, 3000), (-2, -1.2, 1, 1.2), 64).convert("RGB").save(base)
+	else:
+		raise RuntimeError("no engine available to synthesise samples")
+
+	samples = {"png": base}
+	for fmt, ext in (("jpeg", ".jpg"), ("bmp", ".bmp"), ("tiff", ".tiff"), ("webp", ".webp"), ("gif", ".gif"),
+			("psd", ".psd"), ("heic", ".heic"), ("avif", ".avif"), ("jxl", ".jxl")):
+		dst = os.path.join(work_dir, f"sample{ext}")
+		for engine in ENGINES.values():
+			if not engine.available():
+				continue
+			try:
+				engine.write_sample(base, dst)
+			except Exception:
+				continue
+			if os.path.exists(dst) and os.path.getsize(dst) > 0 and probe_format(dst) == fmt:
+				samples[fmt] = dst
+				break
+	return samples
+
+###############################################################################
+
+def _tool_versions() -> dict[str, str]:
+	versions = {}
+	if ENGINES["ffmpeg"].available():
+		res = subprocess.run(["ffmpeg", "-version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=False)
+		versions["ffmpeg"] = res.stdout.decode(errors="replace").partition("\n")[0]
+	if ENGINES["imagemagick"].available():
+		res = subprocess.run([ENGINES["imagemagick"].binary, "-version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=False)
+		versions["imagemagick"] = res.stdout.decode(errors="replace").partition("\n")[0]
+	if Image is not None:
+		versions["pillow"] = Image.__version__
+	return versions
+
+
+def benchmark(samples: dict[str, str], repeat: int = 3) -> dict:
+	"""
+	Time every capable engine on each sample (median of `repeat` scaled decodes
+	at the converter's first-pass width) and rank the ones that succeeded.
+	"""
+	timings: dict[str, dict[str, float]] = {}
+	ranking: dict[str, list[str]] = {}
+	with tempfile.TemporaryDirectory() as out_dir:
+		for fmt, path in sorted(samples.items()):
+			timings[fmt] = {}
+			for engine in ENGINES.values():
+				if not engine.decodes(fmt):
+					continue
+				dst = os.path.join(out_dir, f"{fmt}-{engine.name}.ppm")
+				runs = []
+				try:
+					for _ in range(repeat):
+						t0 = time.perf_counter()
+						engine.decode_scaled(path, dst, 1920, 1, fmt)
+						runs.append(time.perf_counter() - t0)
+				except Exception as e:
+					logger.info(f"{engine.name} failed on {fmt}: {e}")
+					continue
+				timings[fmt][engine.name] = round(statistics.median(runs), 4)
+			ranking[fmt] = sorted(timings[fmt], key=timings[fmt].get)
+	return {
+		"host": {"machine": platform.machine(), "cpus": os.cpu_count(), "python": platform.python_version(), "tools": _tool_versions()},
+		"generated_at": int(time.time()),
+		"timings": timings,
+		"ranking": ranking,
+	}
+
+def _ssim(reference: str, path: str) -> dict[str, float | None]:
+	# "ssim" over all planes and "ssimY" over luma only
+	if not ENGINES["ffmpeg"].available():
+		return {"ssim": None, "ssimY": None}
+	res = subprocess.run(["ffmpeg", "-i", path, "-i", reference, "-lavfi", "ssim", "-f", "null", "-"],
+		stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=False)
+	stderr = res.stderr.decode(errors="replace")
+	scores = {}
+	for key, plane in (("ssim", "All"), ("ssimY", "Y")):
+		match = re.search(rf"{plane}:([0-9.]+)", stderr)
+		scores[key] = float(match.group(1)) if match else None
+	return scores
+
+###############################################################################
+
+def _matched(encoder: Encoder, reference: str, dst: str, subsampling: str, target: float) -> dict | None:
+	# Lowest quality (steps of 5) whose luma SSIM still reaches the legacy output's
+	best = None
+	for quality in range(95, 25, -5):
+		encoder.encode(reference, dst, quality, subsampling)
+		scores = _ssim(reference, dst)
+		if scores["ssimY"] is None or scores["ssimY"] < target:
+			break
+		best = {"quality": quality, "bytes": os.path.getsize(dst), **scores}
+	return best
+
+
+def compare(paths: list[str], quality: int | None = None) -> list[dict]:
+	"""
+	Size/quality of every available encoder against the legacy ffmpeg
+	`-qscale:v 7` output, for each image in `paths`, at the first-pass settings
+	(each encoder's `first_quality` unless `quality` is given).
+	The quality scales differ between encoders, so each also reports the
+	smallest output that matches the legacy luma SSIM ("matched"); luma,
+	because 4:2:0 output is chosen on purpose and the 4:4:4 legacy output
+	would otherwise win on chroma alone. SSIM is measured against the shared
+	1920px decode.
+	"""
+	rows = []
+	with tempfile.TemporaryDirectory() as out_dir:
+		for path in paths:
+			reference = os.path.join(out_dir, "reference.ppm")
+			decode_scaled(path, reference, 1920, source_orientation(path, probe_format(path)))
+			subsampling = chroma_subsampling(reference)
+
+			legacy = os.path.join(out_dir, "legacy.jpg")
+			_run(["ffmpeg", "-y", "-i", reference, "-qscale:v", "7", legacy])
+			row = {"file": os.path.basename(path), "subsampling": subsampling,
+				"legacy": {"bytes": os.path.getsize(legacy), **_ssim(reference, legacy)}}
+			for encoder in ENCODERS:
+				if not encoder.available():
+					continue
+				dst = os.path.join(out_dir, f"{encoder.name}.jpg")
+				encoder.encode(reference, dst, quality or encoder.first_quality, subsampling)
+				row[encoder.name] = {"quality": quality or encoder.first_quality, "bytes": os.path.getsize(dst), **_ssim(reference, dst)}
+				if row["legacy"]["ssimY"] is not None:
+					row[encoder.name]["matched"] = _matched(encoder, reference, dst, subsampling, row["legacy"]["ssimY"])
+			rows.append(row)
+	return rows
+
+###############################################################################
+
+def main(argv: list[str]) -> int:
+	import argparse
+
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	sub = parser.add_subparsers(dest="command", required=True)
+	sub.add_parser("capabilities", help="print detected engine capabilities")
+	bench = sub.add_parser("benchmark", help="rank engines per format on this host")
+	bench.add_argument("--samples", help="directory of sample images (default: synthesise)")
+	bench.add_argument("--repeat", type=int, default=3)
+	bench.add_argument("--out", default=RANKING_PATH)
+	comp = sub.add_parser("compare", help="JPEG size/SSIM per encoder vs the legacy ffmpeg output")
+	comp.add_argument("--samples", help="directory of corpus images (default: synthesise)")
+	comp.add_argument("--quality", type=int, help="one quality for every encoder (default: each one's first pass)")
+	args = parser.parse_args(argv)
+
+	if args.command == "capabilities":
+		print(json.dumps(capabilities(), indent=2))
+		return 0
+
+	if args.command == "compare":
+		with tempfile.TemporaryDirectory() as work_dir:
+			if args.samples:
+				paths = [os.path.join(args.samples, n) for n in sorted(os.listdir(args.samples))]
+				paths = [p for p in paths if os.path.isfile(p) and probe_format(p) != "unknown"]
+			else:
+				paths = list(_make_samples(work_dir).values())
+			rows = compare(paths, quality=args.quality)
+		print(json.dumps(rows, indent=2))
+		names = [e.name for e in ENCODERS if e.available()]
+		legacy_total = sum(r["legacy"]["bytes"] for r in rows)
+		for name in names:
+			total = sum(r[name]["bytes"] for r in rows)
+			line = f"{name:<12} {total:>12} bytes  {100 * total / legacy_total:6.1f}% of legacy"
+			matched = [r[name].get("matched") for r in rows]
+			if all(matched):
+				matched_total = sum(m["bytes"] for m in matched)
+				line += f"   at legacy luma SSIM: {matched_total:>10} bytes  {100 * matched_total / legacy_total:6.1f}%"
+			print(line)
+		return 0
+
+	with tempfile.TemporaryDirectory() as work_dir:
+		if args.samples:
+			samples = {}
+			for name in sorted(os.listdir(args.samples)):
+				path = os.path.join(args.samples, name)
+				if os.path.isfile(path):
+					samples.setdefault(probe_format(path), path)
+			samples.pop("unknown", None)
+		else:
+			samples = _make_samples(work_dir)
+		result = benchmark(samples, repeat=args.repeat)
+
+	with open(args.out, "w") as f:
+		json.dump(result, f, indent=2)
+	print(json.dumps(result["ranking"], indent=2))
+	print(args.out)
+	return 0
+
+###############################################################################
+
+runtime.module_loaded(__name__, _IMPORT_STARTED)
+
+if __name__ == "__main__":
+	logging.basicConfig(level=logging.WARNING)
+	sys.exit(main(sys.argv[1:]))
@@ -1,18 +1,28 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import os
 import json
 import tempfile
 import subprocess
 import logging
 import shutil
+import contextlib
 from decimal import Decimal
 import uuid
 import imghdr
-import time
 from urllib.parse import unquote_plus
 
-import boto3
+import backends
+import metrics
+import processes
+import profiling
+import raw_preview
+import runtime
+import status
+import transfer
 
-# Note: ImageMagick binaries are available in the layer but ffmpeg is used for compatibility
+# Stills go through the engine registry in backends.py (ffmpeg, ImageMagick, Pillow); video is ffmpeg only
 
 # Configure logging
 logger = logging.getLogger()
@@ -20,29 +30,109 @@ logger.setLevel(logging.INFO)
 
 BUCKET_NAME = os.environ["BUCKET_NAME"]
 DYNAMO_TABLE = os.environ["DYNAMO_TABLE"]
-s3 = boto3.client("s3")
-dynamodb = boto3.resource("dynamodb")
+s3 = runtime.Lazy(runtime.client, "s3")
+dynamodb = runtime.Lazy(runtime.resource, "dynamodb")
 
 TARGET_BYTES = 5 * 1024 * 1024
 
+# A conversion lease outlives the 15 minute Lambda timeout so a live run is
+# never taken over; crashed runs free up once it lapses
+LEASE_SECONDS = 960
+
+# Lifetime of the download URL stored with a completed job
+URL_EXPIRES_SECONDS = 3600
+
+# Output container -> content type; images are always JPEG
+VIDEO_FORMATS = {"mp4": "video/mp4", "webm": "video/webm"}
+
+UNSUPPORTED_RAW = "Unsupported RAW file: it has no embedded preview and no RAW decoder (dcraw or ImageMagick) is installed"
+
+
+class ConversionCancelled(Exception):
+	pass
+
+
+# Reports the current phase of the running job (set per job in _run_job)
+_progress_hook = None
+# Stage timings of the running job (set per job in _run_job)
+_metrics: metrics.JobMetrics | None = None
+
 
 def _response(status_code, body):
 	return {"statusCode": status_code, "body": json.dumps(body)}
 
 ###############################################################################
 
-def _write_status(upload_key: str, state: str, extra: dict | None = None):
-	table = dynamodb.Table(DYNAMO_TABLE)
-	payload = {
-		"upload_key": upload_key,
-		"state": state,
-		"source": upload_key,
-		"updated_at": int(time.time()),
-		"ttl": int(time.time()) + (7 * 24 * 60 * 60)  # 7 days TTL
-	}
-	if extra:
-		payload.update(extra)
-	table.put_item(Item=payload)
+def _acquire_lease(lock_key: str, owner: str) -> bool:
+	"""
+	Claim the conversion of one object version. S3 notifications are
+	at-least-once, so the conditional put lets exactly one delivery through.
+	"""
+	table = runtime.table(DYNAMO_TABLE)
+	now = int(time.time())
+	try:
+		table.put_item(
+			Item={
+				"upload_key": lock_key,
+				"owner": owner,
+				"lease_expires": now + LEASE_SECONDS,
+				"done": False,
+				"ttl": now + (7 * 24 * 60 * 60),
+			},
+			ConditionExpression="attribute_not_exists(upload_key) OR (#lease_expires < :now AND #done = :false)",
+			ExpressionAttributeNames={"#lease_expires": "lease_expires", "#done": "done"},
+			ExpressionAttributeValues={":now": now, ":false": False},
+		)
+		return True
+	except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+		return False
+
+
+def _finish_lease(lock_key: str, owner: str, succeeded: bool):
+	# Success pins the lock for good; failure frees it so S3's retry can run
+	table = runtime.table(DYNAMO_TABLE)
+	try:
+		if succeeded:
+			table.update_item(
+				Key={"upload_key": lock_key},
+				UpdateExpression="SET #done = :true",
+				ConditionExpression="#owner = :owner",
+				ExpressionAttributeNames={"#done": "done", "#owner": "owner"},
+				ExpressionAttributeValues={":true": True, ":owner": owner},
+			)
+		else:
+			table.delete_item(
+				Key={"upload_key": lock_key},
+				ConditionExpression="#owner = :owner",
+				ExpressionAttributeNames={"#owner": "owner"},
+				ExpressionAttributeValues={":owner": owner},
+			)
+	except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+		logger.warning(f"Lease {lock_key} is no longer held by {owner}")
+
+###############################################################################
+
+def _check_cancelled(upload_key: str):
+	record = status.get(upload_key, ["state"])
+	if record and record.get("state") == "cancelled":
+		raise ConversionCancelled(f"{upload_key} was cancelled")
+
+###############################################################################
+
+def _between_passes(phase: str | None = None):
+	# Cancellation point between encode passes; the same hook runs during ffmpeg
+	if processes.poll_hook:
+		processes.poll_hook()
+	if phase and _progress_hook:
+		_progress_hook(phase)
+
+
+def _stage(name: str):
+	return _metrics.stage(name) if _metrics else contextlib.nullcontext()
+
+
+def _encode_pass():
+	return _metrics.encode_pass() if _metrics else contextlib.nullcontext()
 
 ###############################################################################
 
@@ -60,22 +150,59 @@ def _download_to_temp(key: str) -> str:
 	fd, path = tempfile.mkstemp(suffix=suffix)
 	os.close(fd)
 	
-	# Use get_object instead of download_file to avoid HeadObject permission issues
+	# Ranged GETs only (no HeadObject, which the bucket policy may forbid);
+	# empty objects answer a ranged GET with 416, so fall back to one stream
 	try:
-		s3.download_file(Bucket=BUCKET_NAME, Key=key, Filename=path)
+		transfer.download(s3, BUCKET_NAME, key, path)
 	except Exception as e:
-		logger.info(f"download_file failed: {e}, trying get_object fallback")
-		obj = s3.get_object(Bucket=BUCKET_NAME, Key=key)
-		with open(path, 'wb') as f:
-			f.write(obj['Body'].read())
+		logger.info(f"Parallel download failed: {e}, trying single-stream fallback")
+		transfer.stream_download(s3, BUCKET_NAME, key, path)
 	
 	return path
 
 ###############################################################################
 
+def _download_range_to_temp(key: str, offset: int, length: int, suffix: str) -> str:
+	fd, path = tempfile.mkstemp(suffix=suffix)
+	os.close(fd)
+	obj = s3.get_object(Bucket=BUCKET_NAME, Key=key, Range=f"bytes={offset}-{offset + length - 1}")
+	with open(path, 'wb') as f:
+		shutil.copyfileobj(obj['Body'], f)
+	return path
+
+###############################################################################
+
+def _s3_range_reader(key: str):
+	def read(offset: int, length: int) -> bytes:
+		obj = s3.get_object(Bucket=BUCKET_NAME, Key=key, Range=f"bytes={offset}-{offset + length - 1}")
+		return obj['Body'].read()
+	return read
+
+###############################################################################
+
 def _upload_from_path(src_path: str, key: str, content_type: str | None = None):
-	extra = {"ContentType": content_type} if content_type else {}
-	s3.upload_file(Filename=src_path, Bucket=BUCKET_NAME, Key=key, ExtraArgs=extra)
+	transfer.upload(s3, BUCKET_NAME, key, src_path, content_type)
+
+###############################################################################
+
+def _analysis_key(key: str) -> str:
+	return f"analysis/{key.removeprefix('uploads/')}.json"
+
+
+def _load_analysis(key: str) -> dict:
+	"""
+	Probe results and pass sizes saved by an earlier run on the same upload,
+	so re-targets can skip detection, probing and passes known not to fit.
+	"""
+	try:
+		obj = s3.get_object(Bucket=BUCKET_NAME, Key=_analysis_key(key))
+		return json.loads(obj['Body'].read())
+	except Exception:
+		return {}
+
+
+def _save_analysis(key: str, analysis: dict):
+	s3.put_object(Bucket=BUCKET_NAME, Key=_analysis_key(key), Body=json.dumps(analysis).encode(), ContentType="application/json")
 
 ###############################################################################
 
@@ -111,19 +238,90 @@ def _detect_image_robust(file_path: str) -> bool:
 
 ###############################################################################
 
+def _copy_range(src: str, dst: str, offset: int, length: int):
+	with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+		fin.seek(offset)
+		while length > 0:
+			chunk = fin.read(min(length, 1024 * 1024))
+			if not chunk:
+				break
+			fout.write(chunk)
+			length -= len(chunk)
+
+###############################################################################
+
+def _raw_decoder_available() -> bool:
+	return bool(shutil.which("dcraw") or backends.ENGINES["imagemagick"].binary)
+
+
+def _decode_raw(src: str) -> str:
+	"""
+	Full RAW decode for files without an embedded preview. Returns a TIFF path;
+	raises ValueError when no RAW-capable decoder is installed (ffmpeg cannot
+	demosaic, so there is no point handing it the file).
+	"""
+	if not _raw_decoder_available():
+		raise ValueError(UNSUPPORTED_RAW)
+	fd, dst = tempfile.mkstemp(suffix=".tiff")
+	os.close(fd)
+	if shutil.which("dcraw"):
+		logger.info(f"Decoding RAW with dcraw: {src}")
+		with open(dst, 'wb') as out:
+			subprocess.run(["dcraw", "-c", "-w", "-T", src], stdout=out, stderr=subprocess.PIPE, check=True)
+		return dst
+	logger.info(f"Decoding RAW with ImageMagick: {src}")
+	_run([backends.ENGINES["imagemagick"].binary, src, dst])
+	return dst
+
+###############################################################################
+
+def _prepare_raw_source(key: str, analysis: dict) -> tuple[str, int]:
+	"""
+	Turn a RAW upload into something ffmpeg can decode, returning the local path
+	and the EXIF orientation to apply. Prefers the embedded JPEG preview, located
+	with ranged reads so the sensor data is never downloaded. The preview
+	location is recorded in `analysis` and reused on later runs.
+	"""
+	known = analysis.get("rawPreview")
+	if known:
+		return _download_range_to_temp(key, known["offset"], known["length"], ".jpg"), known["orientation"]
+
+	lookup_failed = False
+	try:
+		preview = raw_preview.find_preview(_s3_range_reader(key))
+	except Exception as e:
+		logger.info(f"Ranged RAW preview lookup failed: {e}")
+		preview, lookup_failed = None, True
+	if preview:
+		logger.info(f"Using embedded RAW preview {preview.width}x{preview.height} ({preview.length} bytes)")
+		analysis["rawPreview"] = {"offset": preview.offset, "length": preview.length, "orientation": preview.orientation}
+		return _download_range_to_temp(key, preview.offset, preview.length, ".jpg"), preview.orientation
+	if not lookup_failed and not _raw_decoder_available():
+		# No preview and nothing here can demosaic; fail before downloading the sensor data
+		raise ValueError(UNSUPPORTED_RAW)
+
+	src_path = _download_to_temp(key)
+	preview = raw_preview.find_preview(raw_preview.file_reader(src_path))
+	if preview:
+		logger.info(f"Using embedded RAW preview {preview.width}x{preview.height} ({preview.length} bytes)")
+		fd, dst = tempfile.mkstemp(suffix=".jpg")
+		os.close(fd)
+		_copy_range(src_path, dst, preview.offset, preview.length)
+		os.unlink(src_path)
+		analysis["rawPreview"] = {"offset": preview.offset, "length": preview.length, "orientation": preview.orientation}
+		return dst, preview.orientation
+
+	logger.info("No embedded preview found in RAW file")
+	try:
+		return _decode_raw(src_path), 1
+	finally:
+		os.unlink(src_path)
+
+###############################################################################
+
 def _run(cmd: list[str]):
-	# no try/except per user preference; fail fast on nonzero
-	logger.info(f"Running command: {' '.join(cmd)}")
-	result = subprocess.run(cmd, check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-	if result.stderr:
-		logger.info(f"Command stderr: {result.stderr.decode()}")
-	if result.stdout:
-		logger.info(f"Command stdout: {result.stdout.decode()}")
-	if result.returncode != 0:
-		logger.error(f"Command failed with exit code {result.returncode}")
-		logger.error(f"Command stderr: {result.stderr.decode()}")
-		raise subprocess.CalledProcessError(result.returncode, cmd, result.stdout, result.stderr)
-	return result
+	# no try/except per user preference; fail fast on nonzero (processes logs the stderr tail)
+	return processes.run(cmd, check=True)
 
 ###############################################################################
 
@@ -141,142 +339,275 @@ def _estimate_video_bitrate(bytes_target: int, duration_seconds: float, audio_kb
 
 ###############################################################################
 
-def _probe_duration(path: str) -> float:
-	res = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+def _probe(path: str) -> dict:
+	res = subprocess.run(["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
 	try:
-		return float(res.stdout.decode().strip())
+		return json.loads(res.stdout.decode())
+	except Exception:
+		return {}
+
+
+def _probe_duration(probe: dict) -> float:
+	try:
+		return float(probe.get("format", {}).get("duration") or 0)
 	except Exception:
 		return 0.0
 
 ###############################################################################
 
-def _convert_image(src: str, dst: str):
-	# Re-encode as JPEG with decreasing quality until under target
+def _convert_image(src: str, dst: str, orientation: int = 1, target_bytes: int = TARGET_BYTES, analysis: dict | None = None):
+	# Decode once at output size, then re-encode as JPEG with decreasing quality until under target
 	logger.info(f"Converting image: {src} -> {dst}")
-	quality = 85
-	while quality >= 40:
-		logger.info(f"Trying image quality {quality}")
-		_run(["ffmpeg", "-y", "-i", src, "-vf", "scale='min(1920,iw)':-2", "-qscale:v", str(int((100 - quality) / 2) or 1), dst])
-		size = os.path.getsize(dst)
-		logger.info(f"Image output size: {size} bytes (target: {TARGET_BYTES})")
-		if size <= TARGET_BYTES:
-			return
-		quality -= 10
-	# As a fallback, resize more aggressively
-	logger.info("Fallback: resizing more aggressively")
-	_run(["ffmpeg", "-y", "-i", src, "-vf", "scale='min(1280,iw)':-2", "-qscale:v", "8", dst])
-	final_size = os.path.getsize(dst)
-	logger.info(f"Final image size: {final_size} bytes")
+	analysis = analysis if analysis is not None else {}
+	fmt = analysis.get("format")
+	if not fmt:
+		with _stage("probe"):
+			fmt = backends.probe_format(src)
+	analysis["format"] = fmt
+	if orientation == 1:
+		orientation = backends.source_orientation(src, fmt)
+	encoder = backends.jpeg_encoder()
+	# A larger budget (re-targets) buys resolution as well as quality
+	max_width, quality = (1920, encoder.first_quality) if target_bytes <= TARGET_BYTES else (3840, 95)
+	# "width:quality" -> output bytes from this and earlier runs
+	passes = analysis.setdefault("imagePasses", {})
+	fd, scaled = tempfile.mkstemp(suffix=".ppm")
+	os.close(fd)
+	try:
+		with _stage("decode"):
+			engine = backends.decode_scaled(src, scaled, max_width, orientation, fmt)
+		logger.info(f"Decoded {fmt} with {engine.name}: {os.path.getsize(scaled)} bytes intermediate")
+		subsampling = backends.chroma_subsampling(scaled)
+		logger.info(f"Encoding with {encoder.name}, chroma {subsampling}")
+
+		while quality >= 40:
+			known = passes.get(f"{max_width}:{quality}")
+			if known is not None and known > target_bytes:
+				logger.info(f"Skipping quality {quality}: an earlier run produced {known} bytes")
+				quality -= 10
+				continue
+			_between_passes(f"encoding q{quality}")
+			logger.info(f"Trying image quality {quality}")
+			with _encode_pass():
+				encoder.encode(scaled, dst, quality, subsampling)
+			size = os.path.getsize(dst)
+			passes[f"{max_width}:{quality}"] = size
+			logger.info(f"Image output size: {size} bytes (target: {target_bytes})")
+			if size <= target_bytes:
+				return
+			quality -= 10
+		# As a fallback, resize more aggressively
+		_between_passes("encoding fallback")
+		logger.info("Fallback: resizing more aggressively")
+		smaller = scaled.replace(".ppm", "-1280.ppm")
+		try:
+			with _encode_pass():
+				backends.decode_scaled(scaled, smaller, 1280, 1, "ppm")
+				encoder.encode(smaller, dst, 40, "4:2:0")
+		finally:
+			if os.path.exists(smaller):
+				os.unlink(smaller)
+		final_size = os.path.getsize(dst)
+		passes["1280:40"] = final_size
+		logger.info(f"Final image size: {final_size} bytes")
+	finally:
+		os.unlink(scaled)
 
 ###############################################################################
 
-def _convert_video(src: str, dst: str):
+def _video_args(container: str, kbps: int, bufsize_kbps: int, first_pass: bool) -> list[str]:
+	if container == "webm":
+		return ["-c:v", "libvpx-vp9", "-b:v", f"{kbps}k", "-maxrate", f"{kbps}k", "-bufsize", f"{bufsize_kbps}k", "-deadline", "realtime", "-cpu-used", "8", "-row-mt", "1", "-pix_fmt", "yuv420p", "-c:a", "libopus", "-b:a", "64k"]
+	args = ["-c:v", "libx264", "-b:v", f"{kbps}k", "-maxrate", f"{kbps}k", "-bufsize", f"{bufsize_kbps}k"]
+	if first_pass:
+		# H.264 baseline with constrained bitrate and audio
+		args += ["-preset", "veryfast", "-profile:v", "baseline", "-level", "3.0", "-pix_fmt", "yuv420p"]
+	return args + ["-c:a", "aac", "-b:a", "64k"]
+
+###############################################################################
+
+def _convert_video(src: str, dst: str, target_bytes: int = TARGET_BYTES, analysis: dict | None = None, trim: dict | None = None, container: str = "mp4"):
 	logger.info(f"Converting video: {src} -> {dst}")
-	duration = _probe_duration(src)
+	analysis = analysis if analysis is not None else {}
+	if "probe" not in analysis:
+		with _stage("probe"):
+			analysis["probe"] = _probe(src)
+	duration = _probe_duration(analysis["probe"])
+	seek = []
+	if trim:
+		start = float(trim.get("start") or 0)
+		end = float(trim.get("end") or duration)
+		seek = ["-ss", str(start), "-to", str(end)]
+		duration = max(0.0, end - start)
 	logger.info(f"Video duration: {duration} seconds")
-	video_kbps = _estimate_video_bitrate(TARGET_BYTES, duration)
+
+	# An earlier first pass over the same span tells us how far the encoder
+	# over- or undershoots the bitrate estimate for this content
+	passes = analysis.setdefault("videoPasses", [])
+	budget = target_bytes
+	for p in passes:
+		if p["container"] == container and p["seconds"] == duration and not p["scaled"] and p["bytes"]:
+			overshoot = min(2.0, max(0.5, p["bytes"] / p["expected"]))
+			budget = int(target_bytes / overshoot)
+			logger.info(f"Earlier pass overshoot {overshoot:.2f}, budgeting {budget} bytes")
+			break
+	video_kbps = _estimate_video_bitrate(budget, duration)
 	logger.info(f"Target video bitrate: {video_kbps} kbps")
-	
-	# H.264 baseline with constrained bitrate and audio
-	_run(["ffmpeg", "-y", "-i", src, "-c:v", "libx264", "-b:v", f"{video_kbps}k", "-maxrate", f"{video_kbps}k", "-bufsize", f"{video_kbps*2}k", "-preset", "veryfast", "-profile:v", "baseline", "-level", "3.0", "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", "64k", dst])
-	
+
+	_between_passes("encoding pass 1")
+	with _encode_pass():
+		_run(["ffmpeg", "-y", *seek, "-i", src, *_video_args(container, video_kbps, video_kbps * 2, True), dst])
+
 	size = os.path.getsize(dst)
-	logger.info(f"Video output size: {size} bytes (target: {TARGET_BYTES})")
-	
+	passes.append({"container": container, "seconds": duration, "scaled": False, "kbps": video_kbps, "expected": budget, "bytes": size})
+	logger.info(f"Video output size: {size} bytes (target: {target_bytes})")
+
 	# If still too big, scale down and try again
-	if size > TARGET_BYTES:
+	if size > target_bytes:
+		_between_passes("encoding pass 2")
 		reduced_kbps = max(300, int(video_kbps*0.75))
 		logger.info(f"Video too large, retrying with reduced bitrate: {reduced_kbps} kbps and scaling")
-		_run(["ffmpeg", "-y", "-i", src, "-vf", "scale='min(1280,iw)':-2", "-c:v", "libx264", "-b:v", f"{reduced_kbps}k", "-maxrate", f"{reduced_kbps}k", "-bufsize", f"{max(600, int(video_kbps*1.5))}k", "-c:a", "aac", "-b:a", "64k", dst])
+		with _encode_pass():
+			_run(["ffmpeg", "-y", *seek, "-i", src, "-vf", "scale='min(1280,iw)':-2", *_video_args(container, reduced_kbps, max(600, int(video_kbps*1.5)), False), dst])
 		final_size = os.path.getsize(dst)
+		passes.append({"container": container, "seconds": duration, "scaled": True, "kbps": reduced_kbps, "expected": budget, "bytes": final_size})
 		logger.info(f"Final video size: {final_size} bytes")
 
 ###############################################################################
 
-def handle(event, context):
-	logger.info(f"Converter invoked with event: {json.dumps(event)}")
-	
-	# Log available disk space
-	total, used, free = shutil.disk_usage("/tmp")
-	logger.info(f"Ephemeral storage: {free // (1024*1024)} MB free, {total // (1024*1024)} MB total")
-	
-	# S3 put event
-	records = event.get("Records") or []
-	if not records:
-		logger.error("No records in event")
-		return _response(400, {"error": "No records"})
+def _output_name(key: str, job_key: str) -> str:
+	# Re-targets get their own output name so the original stays downloadable
+	name_no_ext, _, _ = key.rpartition("/")[2].rpartition(".")
+	_, _, job_suffix = job_key.partition("#")
+	return f"{name_no_ext}-{job_suffix}" if job_suffix else name_no_ext
 
-	rec = records[0]
-	bucket = rec["s3"]["bucket"]["name"]
-	key_raw = rec["s3"]["object"]["key"]
-	key = unquote_plus(key_raw)  # Decode URL-encoded characters
-	logger.info(f"Processing S3 object: bucket={bucket}, key_raw={key_raw}, key_decoded={key}")
-	logger.info(f"Full S3 event record: {json.dumps(rec, indent=2)}")
-	
-	if bucket != BUCKET_NAME:
-		logger.warning(f"Bucket mismatch: expected {BUCKET_NAME}, got {bucket}")
-		return _response(200, {"skipped": True, "reason": "bucket mismatch"})
 
+def _save_profile(job_profile: profiling.Profile, profile_key: str):
+	# Profiling is a diagnostic; losing the artifact must not fail the job
 	try:
-		# Use event size (avoids HeadObject which may be forbidden by bucket policy)
-		obj_info = rec.get("s3", {}).get("object", {})
-		size = int(obj_info.get("size") or 0)
-		logger.info(f"Object size from event: {size} bytes")
-
-		# Mark processing started
-		_write_status(key, "processing", {"message": "conversion started"})
-
-		# Log file size but always process
-		if size and size <= TARGET_BYTES:
-			logger.info(f"File size {size} <= {TARGET_BYTES} bytes, but processing anyway for potential format conversion")
-
-		# Download
-		logger.info(f"Downloading {key} to temporary file")
-		logger.info(f"Bucket: {BUCKET_NAME}, Key: {repr(key)}")
-		src_path = _download_to_temp(key)
-		logger.info(f"Downloaded to {src_path}")
-		
+		s3.put_object(Bucket=BUCKET_NAME, Key=profile_key, Body=job_profile.artifact(), ContentType="application/gzip")
+		logger.info(f"Profile saved to {profile_key}")
+	except Exception as e:
+		logger.warning(f"Saving profile {profile_key} failed: {e}")
+
+###############################################################################
+
+def _record_metrics(job_metrics: metrics.JobMetrics, outcome: str) -> dict:
+	summary = job_metrics.emit(outcome)
+	# Dashboards read the hourly rollups; never fail a job over them
+	try:
+		status.add_to_rollup(summary, outcome)
+	except Exception as e:
+		logger.warning(f"Rollup update failed: {e}")
+	return summary
+
+###############################################################################
+
+def _run_job(key: str, job_key: str, options: dict, queued_at: float | None = None) -> dict:
+	"""
+	Convert the upload at `key`, recording state under `job_key`. For a plain
+	upload the two are the same; re-targets use a derived job key and pass
+	targetBytes/format/trim in `options`. `queued_at` (epoch seconds) is when
+	the job was handed over, for the queue delay metric. `options["profile"]`
+	(or PROFILE_JOBS=1) profiles the job into an artifact next to the output.
+	"""
+	global _progress_hook, _metrics
+	src_path = dst_path = None
+	_metrics = job_metrics = metrics.JobMetrics(queued_at)
+	job_profile = profile_key = None
+	if options.get("profile") or profiling.ENABLED:
+		job_profile = profiling.Profile(job_key)
+		profile_key = f"processed/{_output_name(key, job_key)}.profile.tar.gz"
+		job_profile.start()
+	try:
+		# The user may have cancelled before the upload finished
+		_check_cancelled(job_key)
+		processes.poll_hook = lambda: _check_cancelled(job_key)
+		_progress_hook = lambda phase: status.progress(job_key, phase)
+
+		# Mark processing started; a job cancelled or completed in the meantime
+		# stays that way, and nothing ran, so no metrics are recorded
+		if not status.transition(job_key, "processing", {"message": "conversion started", "source": key}):
+			logger.info(f"Job {job_key} is already finished, skipping")
+			return _response(200, {"source": key, "skipped": True, "reason": "already finished"})
+		_between_passes("downloading")
+
+		target_bytes = int(options.get("targetBytes") or TARGET_BYTES)
+		analysis = _load_analysis(key)
+		if analysis:
+			logger.info(f"Reusing analysis for {key}: media={analysis.get('media')}")
+
 		# Extract filename from uploads/{uid}/{filename} structure
 		_, _, filename = key.rpartition("/")
 		name_no_ext, _, ext = filename.rpartition(".")
 		logger.info(f"Processing file: {filename} (name: {name_no_ext}, ext: {ext})")
 
-		# Decide media type from file contents using robust detection
-		media_is_image = _detect_image_robust(src_path)
-		logger.info(f"Image detection result for {filename}: {media_is_image}")
-		if media_is_image:
-			out_key = f"processed/{name_no_ext}.jpg"
+		orientation = 1
+		source_bytes = None
+		if raw_preview.is_raw_filename(filename):
+			# RAW stills: pull the embedded preview instead of demosaicing
+			with _stage("download"):
+				src_path, orientation = _prepare_raw_source(key, analysis)
+				# Only the preview is local; metrics count the uploaded file
+				source_bytes = s3.head_object(Bucket=BUCKET_NAME, Key=key)["ContentLength"]
+			analysis["media"] = "image"
+			logger.info(f"RAW source prepared at {src_path} (orientation {orientation})")
+		else:
+			# Download
+			logger.info(f"Downloading {key} to temporary file")
+			logger.info(f"Bucket: {BUCKET_NAME}, Key: {repr(key)}")
+			with _stage("download"):
+				src_path = _download_to_temp(key)
+			logger.info(f"Downloaded to {src_path}")
+
+			# Decide media type from file contents using robust detection
+			if "media" not in analysis:
+				with _stage("probe"):
+					analysis["media"] = "image" if _detect_image_robust(src_path) else "video"
+			logger.info(f"Media type for {filename}: {analysis['media']}")
+		job_metrics.bytes_in = source_bytes or os.path.getsize(src_path)
+		job_metrics.media = analysis["media"]
+		_between_passes("converting")
+
+		out_name = _output_name(key, job_key)
+		if analysis["media"] == "image":
+			if options.get("format", "jpg") != "jpg":
+				raise ValueError(f"Unsupported output format for an image: {options['format']}")
+			out_key = f"processed/{out_name}.jpg"
 			logger.info(f"Converting image to {out_key}")
 			with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
 				dst_path = tmp.name
 			logger.info(f"Image conversion temp file: {dst_path}")
-			_convert_image(src_path, dst_path)
-			output_size = os.path.getsize(dst_path)
-			logger.info(f"Image conversion complete, uploading to {out_key}")
-			_upload_from_path(dst_path, out_key, content_type="image/jpeg")
+			_convert_image(src_path, dst_path, orientation, target_bytes, analysis)
 			output_type = "image/jpeg"
-			os.unlink(dst_path)
 		else:
-			out_key = f"processed/{name_no_ext}.mp4"
+			container = options.get("format", "mp4")
+			if container not in VIDEO_FORMATS:
+				raise ValueError(f"Unsupported output format for a video: {container}")
+			out_key = f"processed/{out_name}.{container}"
 			logger.info(f"Converting video to {out_key}")
-			with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tmp:
+			with tempfile.NamedTemporaryFile(delete=False, suffix=f".{container}") as tmp:
 				dst_path = tmp.name
 			logger.info(f"Video conversion temp file: {dst_path}")
-			_convert_video(src_path, dst_path)
-			output_size = os.path.getsize(dst_path)
-			logger.info(f"Video conversion complete, uploading to {out_key}")
-			_upload_from_path(dst_path, out_key, content_type="video/mp4")
-			output_type = "video/mp4"
-			os.unlink(dst_path)
+			_convert_video(src_path, dst_path, target_bytes, analysis, options.get("trim"), container)
+			output_type = VIDEO_FORMATS[container]
 
-		os.unlink(src_path)
-		logger.info(f"Cleaned up source temp file: {src_path}")
+		output_size = job_metrics.bytes_out = os.path.getsize(dst_path)
+		_between_passes("uploading")
+		logger.info(f"Conversion complete, uploading to {out_key}")
+		with _stage("upload"):
+			_upload_from_path(dst_path, out_key, content_type=output_type)
+		_save_analysis(key, analysis)
 
-		# Generate presigned URL for output to avoid HeadObject during status polling
+		# Presign once here so status polls can answer from the record alone
 		url = s3.generate_presigned_url(
 			ClientMethod="get_object",
-			Params={"Bucket": BUCKET_NAME, "Key": out_key},
-			ExpiresIn=3600,
+			Params={
+				"Bucket": BUCKET_NAME,
+				"Key": out_key,
+				"ResponseContentDisposition": f"attachment; filename=\"{os.path.basename(out_key)}\"",
+			},
+			ExpiresIn=URL_EXPIRES_SECONDS,
 		)
 		result = {
 			"source": key,
@@ -284,15 +615,106 @@ def handle(event, context):
 			"outputSize": output_size,
 			"outputType": output_type,
 			"url": url,
+			"urlExpires": int(time.time()) + URL_EXPIRES_SECONDS,
+			"metrics": _record_metrics(job_metrics, "completed"),
 		}
+		if profile_key:
+			result["profile"] = profile_key
 		logger.info(f"Conversion successful: {json.dumps(result)}")
-		_write_status(key, "completed", result)
+		status.transition(job_key, "completed", result)
 		return _response(200, result)
-		
+
+	except ConversionCancelled:
+		# Status already says cancelled; returning normally avoids async retries
+		logger.info(f"Conversion cancelled: {job_key}")
+		_record_metrics(job_metrics, "cancelled")
+		return _response(200, {"source": key, "cancelled": True})
+
 	except Exception as e:
-		logger.error(f"Error processing {key}: {str(e)}", exc_info=True)
+		logger.error(f"Error processing {job_key}: {str(e)}", exc_info=True)
 		try:
-			_write_status(key, "failure", {"error": str(e)})
+			failure = {"error": str(e), "source": key, "metrics": _record_metrics(job_metrics, "failure")}
+			if profile_key:
+				failure["profile"] = profile_key
+			status.transition(job_key, "failure", failure)
 		except Exception:
 			pass
 		raise
+
+	finally:
+		processes.poll_hook = None
+		_progress_hook = None
+		_metrics = None
+		if job_profile:
+			job_profile.stop()
+			job_profile.meta["metrics"] = job_metrics.summary()
+			_save_profile(job_profile, profile_key)
+		# /tmp survives across warm invocations, so never leave files behind
+		for path in (src_path, dst_path):
+			if path and os.path.exists(path):
+				os.unlink(path)
+				logger.info(f"Cleaned up temp file: {path}")
+
+###############################################################################
+
+def _run_exclusive(key: str, job_key: str, options: dict, object_id: str, owner: str, queued_at: float | None = None) -> dict:
+	lock_key = f"lock#{job_key}#{object_id}"
+	if not _acquire_lease(lock_key, owner):
+		logger.info(f"Duplicate delivery for {job_key} ({object_id}), skipping")
+		return _response(200, {"skipped": True, "reason": "duplicate"})
+	try:
+		result = _run_job(key, job_key, options, queued_at)
+	except Exception:
+		_finish_lease(lock_key, owner, succeeded=False)
+		raise
+	_finish_lease(lock_key, owner, succeeded=True)
+	return result
+
+###############################################################################
+
+def handle(event, context):
+	runtime.report_startup()
+	logger.info(f"Converter invoked with event: {json.dumps(event, separators=(',', ':'))}")
+	owner = getattr(context, "aws_request_id", None) or uuid.uuid4().hex
+	
+	# Log available disk space
+	total, used, free = shutil.disk_usage("/tmp")
+	logger.info(f"Ephemeral storage: {free // (1024*1024)} MB free, {total // (1024*1024)} MB total")
+
+	# Re-target request invoked directly by the app Lambda
+	if "retarget" in event:
+		job = event["retarget"]
+		return _run_exclusive(job["key"], job["jobKey"], job.get("options") or {}, "retarget", owner, job.get("requestedAt"))
+	
+	# S3 put event
+	records = event.get("Records") or []
+	if not records:
+		logger.error("No records in event")
+		return _response(400, {"error": "No records"})
+
+	rec = records[0]
+	bucket = rec["s3"]["bucket"]["name"]
+	key_raw = rec["s3"]["object"]["key"]
+	key = unquote_plus(key_raw)  # Decode URL-encoded characters
+	logger.info(f"Processing S3 object: bucket={bucket}, key_raw={key_raw}, key_decoded={key}")
+	
+	if bucket != BUCKET_NAME:
+		logger.warning(f"Bucket mismatch: expected {BUCKET_NAME}, got {bucket}")
+		return _response(200, {"skipped": True, "reason": "bucket mismatch"})
+
+	# Use event size (avoids HeadObject which may be forbidden by bucket policy)
+	obj_info = rec.get("s3", {}).get("object", {})
+	size = int(obj_info.get("size") or 0)
+	logger.info(f"Object size from event: {size} bytes")
+
+	# Log file size but always process
+	if size and size <= TARGET_BYTES:
+		logger.info(f"File size {size} <= {TARGET_BYTES} bytes, but processing anyway for potential format conversion")
+
+	# Version id (versioned buckets) or ETag identifies this exact object write
+	object_id = obj_info.get("versionId") or obj_info.get("eTag") or obj_info.get("sequencer") or "unversioned"
+	return _run_exclusive(key, key, {}, object_id, owner, metrics.event_time(rec.get("eventTime")))
+
+###############################################################################
+
+runtime.module_loaded(__name__, _IMPORT_STARTED)
@@ -22,6 +22,7 @@ fi
 
 LAYER_DIR="layer"
 BIN_DIR="${LAYER_DIR}/bin"
+PYTHON_DIR="${LAYER_DIR}/python"
 mkdir -p "${BIN_DIR}"
 
 # Build/download ffmpeg layer binaries (linux static)
@@ -55,7 +56,29 @@ build_ffmpeg_layer() {
 	echo "ffmpeg and ffprobe installed to ${BIN_DIR}" >&2
 }
 
+# Install the layer's Python packages (layer-requirements.txt) as Lambda
+# wheels into layer/python, which the runtime puts on sys.path as /opt/python
+build_python_layer() {
+	if [ -d "${PYTHON_DIR}" ] && [ "${PYTHON_DIR}" -nt layer-requirements.txt ]; then
+		echo "Python layer packages already present in ${PYTHON_DIR}" >&2
+		return 0
+	fi
+
+	case "${ARCH}" in
+		x86_64) PIP_PLATFORM="manylinux2014_x86_64" ;;
+		arm64)  PIP_PLATFORM="manylinux2014_aarch64" ;;
+		*) echo "Unsupported ARCH=${ARCH}. Use x86_64 or arm64." >&2; exit 1 ;;
+	esac
+
+	rm -rf "${PYTHON_DIR}"
+	python3 -m pip install --quiet --target "${PYTHON_DIR}" \
+		--platform "${PIP_PLATFORM}" --implementation cp --python-version 3.11 \
+		--only-binary=:all: -r layer-requirements.txt
+	echo "Python packages installed to ${PYTHON_DIR}" >&2
+}
+
 build_ffmpeg_layer
+build_python_layer
 
 # Deploy
 DEPLOY_CMD=(sls deploy --stage "$STAGE" --region "$REGION" --verbose)
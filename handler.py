@@ -1,15 +1,60 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import os
 import json
 import base64
 import uuid
-import time
+import gzip
+import hashlib
+from collections import OrderedDict
 
-import boto3
+import runtime
+import status
 
 BUCKET_NAME = os.environ["BUCKET_NAME"]
-DYNAMO_TABLE = os.environ["DYNAMO_TABLE"]
-s3 = boto3.client("s3")
-dynamodb = boto3.resource("dynamodb")
+CONVERTER_FUNCTION = os.environ.get("CONVERTER_FUNCTION", "")
+# Created on first use; the index page never needs them
+s3 = runtime.Lazy(runtime.client, "s3")
+lambda_client = runtime.Lazy(runtime.client, "lambda")
+
+# Download URLs are re-issued once they are this close to expiring
+URL_EXPIRES_SECONDS = 3600
+URL_REFRESH_MARGIN = 300
+
+# Per-container memo of finished jobs' status responses: key -> (until, body)
+FINISHED_CACHE_SIZE = 512
+FINISHED_CACHE_SECONDS = 600
+_finished_cache: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+# Batch status: keys per request and the attributes the response is built from
+MAX_STATUS_KEYS = 100
+STATUS_ATTRIBUTES = ["state", "error", "ph", "output", "outputSize", "outputType", "url", "urlExpires"]
+
+# Long-poll: a status request may be held until something changes. Capped below
+# the 30 s API/Lambda timeout; re-reads back off from 1 s to 3 s
+MAX_WAIT_SECONDS = 25
+LONG_POLL_INTERVAL = 1.0
+LONG_POLL_MAX_INTERVAL = 3.0
+# Suggested delay before the next poll when the request was not held
+POLL_INTERVAL_SECONDS = 3
+
+# Files up to this size skip multipart and go up with one presigned PUT
+SINGLE_PUT_MAX_BYTES = 16 * 1024 * 1024
+
+# The page is revalidated against its ETag after an hour; until then (and while
+# revalidating, for a week) browsers use their copy without calling the Lambda
+INDEX_CACHE_CONTROL = "public, max-age=3600, stale-while-revalidate=604800"
+
+# Part URLs are signed locally in batches; S3 allows at most 10,000 parts
+PART_URL_EXPIRES_SECONDS = 3600
+MAX_PART_URLS = 500
+S3_MAX_PARTS = 10000
+
+# Re-target limits
+MIN_TARGET_BYTES = 512 * 1024
+MAX_TARGET_BYTES = 100 * 1024 * 1024
+RETARGET_FORMATS = {"jpg", "mp4", "webm"}
 
 
 INDEX_HTML = """
@@ -423,6 +468,9 @@ INDEX_HTML = """
       </label>
 
       <div class="actions">
+        <label class="muted" title="Large photos are scaled to the converter's 1920px width on this device first; turn off to keep full resolution for re-converting at larger sizes">
+          <input id="shrinkPhotos" type="checkbox" checked /> Shrink large photos before upload
+        </label>
         <button id="convert" class="btn" disabled>Convert</button>
       </div>
       <div id="startStatus" class="muted" style="margin-top:12px;">
@@ -441,6 +489,7 @@ INDEX_HTML = """
       </div>
       <div class="actions">
         <button id="processingDownload" class="btn" disabled>Download</button>
+        <button id="cancelJobs" class="btn secondary" type="button">Cancel</button>
         <button id="convertMore" class="btn secondary with-icon hidden" type="button" aria-label="Convert More (opens in a new tab)">
           Convert More
           <svg width="18" height="18" viewBox="0 0 24 24" fill="none" xmlns="http://www.w3.org/2000/svg" aria-hidden="true">
@@ -449,6 +498,15 @@ INDEX_HTML = """
           </svg>
         </button>
       </div>
+      <div id="retargetRow" class="actions hidden">
+        <span class="muted">Need a different size?</span>
+        <select id="retargetSize" style="background: var(--surface-2); color: var(--text); border: 1px solid var(--border); border-radius: 8px; padding: 8px;">
+          <option value="2">2 MB</option>
+          <option value="10" selected>10 MB</option>
+          <option value="25">25 MB</option>
+        </select>
+        <button id="retarget" class="btn secondary" type="button">Re-convert</button>
+      </div>
     </section>
   </main>
 
@@ -456,7 +514,20 @@ INDEX_HTML = """
   </footer>
 
 <script>
-const CHUNK_SIZE = 10 * 1024 * 1024; // 10MB per part
+const MB = 1024 * 1024;
+const CHUNK_SIZE = 10 * MB; // starting part size
+const MIN_PART_SIZE = 5 * MB; // S3 minimum for every part but the last
+const MAX_PART_SIZE = 64 * MB;
+const MAX_PARTS = 10000; // S3 limit per multipart upload
+const TARGET_PART_SECONDS = 5; // parts are sized to take about this long at the measured speed
+const SINGLE_PUT_MAX = CHUNK_SIZE; // smaller files go up in one presigned PUT
+const RESUME_MAX_AGE_MS = 24 * 60 * 60 * 1000; // unfinished uploads older than this start over
+const SHRINK_MAX_WIDTH = 1920; // the converter's own output width for stills
+const SHRINK_MIN_BYTES = 2 * MB; // smaller photos are not worth the decode
+const SHRINK_QUALITY = 0.92; // high, so the server's quality search keeps its headroom
+const FILE_CONCURRENCY = 3; // files uploading at once
+const PART_CONCURRENCY = 6; // part PUTs in flight across all files
+const PART_RETRIES = 4;
 const TARGET_BYTES = 5 * 1024 * 1024; // 5MB size threshold
 
 function byId(id) { return document.getElementById(id); }
@@ -526,23 +597,120 @@ function getDownloadFilename(status) {
 
 // Indeterminate processing animation handled by CSS class 'animated'
 
-async function initiateMultipart(filename, contentType) {
+async function initiateMultipart(filename, contentType, parts) {
   const res = await fetch('/api/multipart/initiate', {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({ filename, contentType })
+    body: JSON.stringify({ filename, contentType, parts })
   });
   if (!res.ok) throw new Error('Failed to initiate');
   return res.json();
 }
 
-async function getPresignedPartUrl(key, uploadId, partNumber) {
-  const params = new URLSearchParams({ key, uploadId, partNumber: String(partNumber) });
-  const res = await fetch(`/api/multipart/url?${params.toString()}`, { method: 'GET' });
-  if (!res.ok) throw new Error('Failed to get URL');
+async function requestSingleUpload(filename, contentType, size) {
+  const res = await fetch('/api/upload', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ filename, contentType, size })
+  });
+  if (!res.ok) throw new Error('Failed to start upload');
+  return res.json();
+}
+
+async function getPresignedPartUrls(key, uploadId, start, count) {
+  const params = new URLSearchParams({ key, uploadId, start: String(start), count: String(count) });
+  const res = await fetch(`/api/multipart/urls?${params.toString()}`, { method: 'GET' });
+  if (!res.ok) throw new Error('Failed to get URLs');
+  return res.json();
+}
+
+// Part URLs arrive in batches (the first with initiate); only go back to the
+// server for parts not covered yet or when the batch is about to expire
+function partUrlCache(key, uploadId, estimateParts, first) {
+  let urls = {};
+  let expiresAt = 0;
+  const take = (batch) => {
+    if (!batch || !batch.urls) return;
+    Object.assign(urls, batch.urls);
+    expiresAt = Date.now() + batch.expiresIn * 1000;
+  };
+  take(first);
+  let fetching = null; // parallel parts share one in-flight refill
+  return async (partNumber) => {
+    if (Date.now() > expiresAt - 5 * 60 * 1000) urls = {};
+    for (let tries = 0; !urls[partNumber]; tries++) {
+      if (tries === 2) throw new Error(`No upload URL for part ${partNumber}`);
+      fetching = fetching || getPresignedPartUrls(key, uploadId, partNumber, Math.max(1, estimateParts() - partNumber + 1))
+        .then(take)
+        .finally(() => { fetching = null; });
+      await fetching;
+    }
+    return urls[partNumber];
+  };
+}
+
+async function listUploadedParts(key, uploadId) {
+  const params = new URLSearchParams({ key, uploadId });
+  const res = await fetch(`/api/multipart/parts?${params.toString()}`, { method: 'GET' });
+  if (!res.ok) throw new Error('Failed to list parts');
   return res.json();
 }
 
+// Unfinished multipart uploads live in IndexedDB, keyed by file, so a dropped
+// connection or a reload can pick up where it stopped. Storage is best effort.
+let resumeDb = null;
+function openResumeDb() {
+  if (!window.indexedDB) return Promise.resolve(null);
+  resumeDb = resumeDb || new Promise((resolve) => {
+    const req = indexedDB.open('fivemb-uploads', 1);
+    req.onupgradeneeded = () => req.result.createObjectStore('uploads');
+    req.onsuccess = () => resolve(req.result);
+    req.onerror = () => resolve(null);
+  });
+  return resumeDb;
+}
+
+async function resumeStore(method, ...args) {
+  const db = await openResumeDb();
+  if (!db) return null;
+  return new Promise((resolve) => {
+    const tx = db.transaction('uploads', method === 'get' ? 'readonly' : 'readwrite');
+    const req = tx.objectStore('uploads')[method](...args);
+    req.onsuccess = () => resolve(req.result);
+    req.onerror = () => resolve(null);
+  });
+}
+
+function fileFingerprint(file) { return `${file.name}:${file.size}:${file.lastModified}`; }
+
+// Planned parts of a saved upload that S3 confirms (same number and size) are
+// kept; the rest are sent again with their original number and byte range
+async function resumableUpload(file) {
+  const saved = await resumeStore('get', fileFingerprint(file));
+  if (!saved || Date.now() - saved.savedAt > RESUME_MAX_AGE_MS) return null;
+  let listed;
+  try {
+    listed = await listUploadedParts(saved.key, saved.uploadId);
+  } catch (error) {
+    return null;
+  }
+  const have = {};
+  listed.parts.forEach(p => { have[p.PartNumber] = p; });
+  const done = [];
+  const redo = [];
+  let offset = 0;
+  let partNumber = 0;
+  for (const [n, range] of Object.entries(saved.parts)) {
+    const number = Number(n);
+    const part = { partNumber: number, start: range.start, end: range.end };
+    if (have[number] && have[number].Size === range.end - range.start) done.push({ ...part, etag: have[number].ETag });
+    else redo.push(part);
+    offset = Math.max(offset, range.end);
+    partNumber = Math.max(partNumber, number);
+  }
+  return { saved, done, redo, offset, partNumber };
+}
+
 async function completeMultipart(key, uploadId, parts) {
   const res = await fetch('/api/multipart/complete', {
     method: 'POST',
@@ -553,6 +721,26 @@ async function completeMultipart(key, uploadId, parts) {
   return res.json();
 }
 
+async function cancelJob(key, uploadId) {
+  const res = await fetch('/api/cancel', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ key, uploadId })
+  });
+  if (!res.ok) throw new Error('Failed to cancel');
+  return res.json();
+}
+
+async function retargetJob(key, targetBytes) {
+  const res = await fetch('/api/retarget', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ key, targetBytes })
+  });
+  if (!res.ok) throw new Error('Failed to re-convert');
+  return res.json();
+}
+
 async function checkStatus(key) {
   const params = new URLSearchParams({ key });
   const res = await fetch(`/api/status?${params.toString()}`, { method: 'GET' });
@@ -560,7 +748,108 @@ async function checkStatus(key) {
   return res.json();
 }
 
-function getNumParts(size, chunkSize) { return Math.ceil(size / chunkSize); }
+// Long-polls: the server holds the request up to `wait` seconds until a job changes
+async function checkStatuses(keys, wait = 10, signal = undefined) {
+  const chunks = [];
+  for (let i = 0; i < keys.length; i += 100) chunks.push(keys.slice(i, i + 100));
+  const results = await Promise.all(chunks.map(async (chunk) => {
+    const res = await fetch('/api/status', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ keys: chunk, wait }),
+      signal
+    });
+    if (!res.ok) throw new Error('Failed to check status');
+    return res.json();
+  }));
+  const statuses = {};
+  let retryAfter = 0;
+  for (const r of results) {
+    Object.assign(statuses, r.statuses);
+    retryAfter = Math.max(retryAfter, r.retryAfter || 0);
+  }
+  return { statuses, retryAfter };
+}
+
+// Cuts a file into parts on demand. Sizes start from the file size and S3's
+// part limit, then follow the upload speed measured on finished parts
+function partPlanner(fileSize, resumeAt = { offset: 0, partNumber: 0 }) {
+  let offset = resumeAt.offset;
+  let partNumber = resumeAt.partNumber;
+  let partSize = Math.max(CHUNK_SIZE, Math.ceil(fileSize / MAX_PARTS));
+  return {
+    next() {
+      if (offset >= fileSize) return null;
+      // Never leave more bytes than the remaining part numbers can carry
+      const floor = Math.ceil((fileSize - offset) / (MAX_PARTS - partNumber));
+      let end = Math.min(offset + Math.max(partSize, floor), fileSize);
+      // A tail below the S3 minimum rides along with this part
+      if (fileSize - end < MIN_PART_SIZE) end = fileSize;
+      const part = { partNumber: ++partNumber, start: offset, end };
+      offset = end;
+      return part;
+    },
+    measured(bytes, seconds) {
+      // Per-stream speed, smoothed so one slow or fast part does not swing it
+      const ideal = (bytes / Math.max(seconds, 0.001)) * TARGET_PART_SECONDS;
+      const size = Math.min(MAX_PART_SIZE, Math.max(MIN_PART_SIZE, (partSize + ideal) / 2));
+      partSize = Math.max(Math.round(size / MB) * MB, Math.ceil(fileSize / MAX_PARTS));
+    },
+    estimate() { return partNumber + Math.ceil((fileSize - offset) / partSize); }
+  };
+}
+
+// Shared window of part PUTs so several files together never exceed PART_CONCURRENCY
+const partSlots = { free: PART_CONCURRENCY, waiting: [] };
+async function withPartSlot(fn) {
+  if (partSlots.free > 0) partSlots.free--;
+  else await new Promise(r => partSlots.waiting.push(r));
+  try {
+    return await fn();
+  } finally {
+    const next = partSlots.waiting.shift();
+    if (next) next(); else partSlots.free++;
+  }
+}
+
+// XHR rather than fetch so upload progress is reported while bytes are in flight
+function putPart(url, blob, onProgress, upload, contentType) {
+  return new Promise((resolve, reject) => {
+    const xhr = new XMLHttpRequest();
+    upload.requests.add(xhr);
+    xhr.open('PUT', url);
+    // A single-PUT URL is signed for this content type
+    if (contentType) xhr.setRequestHeader('Content-Type', contentType);
+    xhr.upload.onprogress = (e) => onProgress(e.loaded);
+    xhr.onload = () => {
+      upload.requests.delete(xhr);
+      if (xhr.status >= 200 && xhr.status < 300) resolve(xhr.getResponseHeader('ETag'));
+      else reject(new Error(`HTTP ${xhr.status}`));
+    };
+    xhr.onerror = () => { upload.requests.delete(xhr); reject(new Error('Network error')); };
+    xhr.onabort = () => { upload.requests.delete(xhr); reject(new Error('Cancelled')); };
+    xhr.send(blob);
+  });
+}
+
+async function putPartWithRetry(partUrl, partNumber, blob, onProgress, upload) {
+  for (let attempt = 0; ; attempt++) {
+    if (window.__cancelled || upload.failed) throw new Error('Cancelled');
+    try {
+      return await withPartSlot(async () => {
+        const url = await partUrl(partNumber);
+        const started = performance.now();
+        const etag = await putPart(url, blob, onProgress, upload);
+        return { etag, seconds: (performance.now() - started) / 1000 };
+      });
+    } catch (error) {
+      onProgress(0);
+      if (window.__cancelled || attempt + 1 >= PART_RETRIES) throw new Error(`Part ${partNumber} failed: ${error.message}`);
+      // Exponential backoff with jitter: ~0.5s, 1s, 2s
+      await new Promise(r => setTimeout(r, 500 * 2 ** attempt * (0.5 + Math.random())));
+    }
+  }
+}
 
 // Global array to store selected files
 window.__selectedFiles = [];
@@ -689,12 +978,76 @@ function addFiles(newFiles) {
 
 // Global tracking for multi-file upload
 window.__activeUploads = [];
+window.__cancelled = false;
+
+function inFlightUploads() {
+  return window.__activeUploads.filter(u => u.key && (u.status === 'uploading' || u.status === 'processing'));
+}
+
+// Stop server-side work for everything still uploading or converting
+async function cancelAll() {
+  window.__cancelled = true;
+  window.__activeUploads.forEach(u => {
+    if (u.requests) u.requests.forEach(xhr => xhr.abort());
+    // A cancelled upload is aborted server-side, so it cannot be resumed
+    if (u.status !== 'processing') resumeStore('delete', fileFingerprint(u.file));
+  });
+  const pending = inFlightUploads();
+  await Promise.all(pending.map(u => cancelJob(u.key, u.status === 'uploading' ? u.uploadId : null).catch(() => null)));
+  window.__activeUploads.forEach((upload, i) => {
+    if (upload.status === 'uploading' || upload.status === 'processing' || upload.status === 'pending') {
+      updateFileStatus(i, 'failed', 'Cancelled');
+    }
+  });
+  byId('cancelJobs').classList.add('hidden');
+  if (window.__selectedFiles.length === 1) {
+    byId('progressFill').classList.remove('animated');
+    byId('percent').classList.remove('hidden');
+    setStatus('Cancelled', 'muted');
+    byId('convert').disabled = false;
+    showScreen('start');
+  }
+}
+
+// Convert the already-uploaded source again for a different size limit
+async function retargetSingle() {
+  const upload = window.__activeUploads[0];
+  if (!upload || !upload.key) return;
+  upload.sourceKey = upload.sourceKey || upload.key;
+  const targetMB = Number(byId('retargetSize').value);
+  const { key } = await retargetJob(upload.sourceKey, targetMB * 1024 * 1024);
+  upload.key = key;
+  updateFileStatus(0, 'processing', 'Processing...');
+  window.__cancelled = false;
+  byId('retargetRow').classList.add('hidden');
+  byId('cancelJobs').classList.remove('hidden');
+  const dlBtn = byId('processingDownload');
+  dlBtn.disabled = true;
+  setStatus(`Re-converting for ${targetMB} MB...`, 'muted');
+  byId('progressFill').classList.add('animated');
+  byId('percent').classList.add('hidden');
+  pollAllFiles();
+}
+
+// Closing the tab abandons conversions, so tell the server not to finish them.
+// Unfinished uploads are left alone: their parts and IndexedDB record let a
+// reload resume them, and a half-sent upload never reaches the converter.
+window.addEventListener('pagehide', () => {
+  if (window.__cancelled || !navigator.sendBeacon) return;
+  for (const u of inFlightUploads()) {
+    if (u.status !== 'processing') continue;
+    navigator.sendBeacon('/api/cancel', new Blob([JSON.stringify({ key: u.key })], { type: 'application/json' }));
+  }
+});
 
 async function uploadAndProcess() {
   const files = window.__selectedFiles;
   if (!files || files.length === 0) return;
 
   byId('convert').disabled = true;
+  window.__cancelled = false;
+  byId('retargetRow').classList.add('hidden');
+  byId('cancelJobs').classList.remove('hidden');
   showScreen('processing');
   
   // Initialize the processing screen for multiple files
@@ -707,59 +1060,90 @@ async function uploadAndProcess() {
     key: null,
     status: 'pending',
     error: null,
-    downloadUrl: null
+    downloadUrl: null,
+    requests: new Set()
   }));
   
-  // Upload all files sequentially
-  for (let i = 0; i < files.length; i++) {
-    try {
-      await uploadSingleFile(i);
-    } catch (error) {
-      console.error(`Failed to upload file ${i}:`, error);
-      updateFileStatus(i, 'failed', error.message);
+  // Poll while uploading so finished files start showing results straight away
+  pollAllFiles();
+  
+  // Upload several files at once; a slow file no longer holds up the others
+  let next = 0;
+  const worker = async () => {
+    while (next < files.length && !window.__cancelled) {
+      const i = next++;
+      try {
+        await uploadSingleFile(i);
+      } catch (error) {
+        console.error(`Failed to upload file ${i}:`, error);
+        if (!window.__cancelled) updateFileStatus(i, 'failed', error.message);
+      }
     }
+  };
+  await Promise.all(Array.from({ length: Math.min(FILE_CONCURRENCY, files.length) }, worker));
+}
+
+// Decode and scale in a worker so the page stays responsive on big batches
+const SHRINK_WORKER = `
+self.onmessage = async (e) => {
+  const { file, maxWidth, quality } = e.data;
+  try {
+    const bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+    if (bitmap.width <= maxWidth) {
+      bitmap.close();
+      self.postMessage({ blob: null });
+      return;
+    }
+    const height = Math.round(bitmap.height * maxWidth / bitmap.width);
+    const canvas = new OffscreenCanvas(maxWidth, height);
+    const ctx = canvas.getContext('2d');
+    ctx.imageSmoothingQuality = 'high';
+    ctx.drawImage(bitmap, 0, 0, maxWidth, height);
+    bitmap.close();
+    self.postMessage({ blob: await canvas.convertToBlob({ type: 'image/jpeg', quality }) });
+  } catch (error) {
+    self.postMessage({ blob: null, error: String(error) });
   }
-  
-  // Start polling for all uploaded files
-  pollAllFiles();
+};`;
+let shrinkWorkerUrl = null;
+
+function shrinkInWorker(file) {
+  shrinkWorkerUrl = shrinkWorkerUrl || URL.createObjectURL(new Blob([SHRINK_WORKER], { type: 'text/javascript' }));
+  return new Promise((resolve) => {
+    const worker = new Worker(shrinkWorkerUrl);
+    const done = (blob) => { worker.terminate(); resolve(blob); };
+    worker.onmessage = (e) => done(e.data.blob);
+    worker.onerror = () => done(null);
+    worker.postMessage({ file, maxWidth: SHRINK_MAX_WIDTH, quality: SHRINK_QUALITY });
+  });
+}
+
+// Optional: oversized photos are scaled to the converter's width before upload.
+// Anything the browser cannot decode (HEIC, RAW) or that does not shrink goes as is.
+async function maybeShrink(upload) {
+  const file = upload.file;
+  const toggle = byId('shrinkPhotos');
+  if (!toggle || !toggle.checked || !file.type.startsWith('image/') || file.size < SHRINK_MIN_BYTES) return;
+  if (typeof OffscreenCanvas === 'undefined' || typeof createImageBitmap === 'undefined' || typeof Worker === 'undefined') return;
+  const blob = await shrinkInWorker(file);
+  if (!blob || blob.size >= file.size) return;
+  const name = file.name.replace(/[.][^.]*$/, '') + '.jpg';
+  upload.originalSize = file.size;
+  upload.file = new File([blob], name, { type: 'image/jpeg', lastModified: file.lastModified });
 }
 
 async function uploadSingleFile(fileIndex) {
   const upload = window.__activeUploads[fileIndex];
-  const file = upload.file;
   
   updateFileStatus(fileIndex, 'uploading', `Uploading...`);
+  await maybeShrink(upload);
+  const file = upload.file;
   
-  const { uploadId, key } = await initiateMultipart(file.name, file.type || 'application/octet-stream');
-  upload.key = key;
-  
-  const numParts = getNumParts(file.size, CHUNK_SIZE);
-  const etags = [];
-
-  for (let partNumber = 1; partNumber <= numParts; partNumber++) {
-    const start = (partNumber - 1) * CHUNK_SIZE;
-    const end = Math.min(start + CHUNK_SIZE, file.size);
-    const blob = file.slice(start, end);
-
-    const { url } = await getPresignedPartUrl(key, uploadId, partNumber);
-    const putRes = await fetch(url, { method: 'PUT', body: blob });
-    if (!putRes.ok) throw new Error(`Part ${partNumber} failed`);
-
-    const etag = putRes.headers.get('ETag');
-    etags.push({ ETag: etag, PartNumber: partNumber });
-
-    // Update progress for this specific file
-    const progress = Math.round((partNumber / numParts) * 100);
-    updateFileProgress(fileIndex, progress);
-    
-    // For single file, also update the main progress bar
-    if (window.__selectedFiles.length === 1) {
-      setProgress(progress);
-      setStatus('Uploading...', 'muted');
-    }
+  if (file.size > 0 && file.size <= SINGLE_PUT_MAX) {
+    await uploadSmallFile(fileIndex);
+  } else {
+    await uploadMultipart(fileIndex);
   }
-
-  await completeMultipart(key, uploadId, etags);
   updateFileStatus(fileIndex, 'processing', 'Processing...');
   
   // For single file, update main status
@@ -771,6 +1155,104 @@ async function uploadSingleFile(fileIndex) {
   }
 }
 
+function reportFileProgress(fileIndex, sent, size) {
+  const progress = Math.round((sent / Math.max(size, 1)) * 100);
+  updateFileProgress(fileIndex, progress);
+  if (window.__selectedFiles.length === 1) {
+    setProgress(progress);
+    setStatus('Uploading...', 'muted');
+  }
+}
+
+// Small files: one call for a presigned PUT, one PUT, and the converter starts
+async function uploadSmallFile(fileIndex) {
+  const upload = window.__activeUploads[fileIndex];
+  const file = upload.file;
+  const { key, url, contentType } = await requestSingleUpload(file.name, file.type || 'application/octet-stream', file.size);
+  upload.key = key;
+  for (let attempt = 0; ; attempt++) {
+    if (window.__cancelled) throw new Error('Cancelled');
+    try {
+      await withPartSlot(() => putPart(url, file, (sent) => reportFileProgress(fileIndex, sent, file.size), upload, contentType));
+      return;
+    } catch (error) {
+      if (window.__cancelled || attempt + 1 >= PART_RETRIES) throw new Error(`Upload failed: ${error.message}`);
+      await new Promise(r => setTimeout(r, 500 * 2 ** attempt * (0.5 + Math.random())));
+    }
+  }
+}
+
+async function uploadMultipart(fileIndex) {
+  const upload = window.__activeUploads[fileIndex];
+  const file = upload.file;
+  const fingerprint = fileFingerprint(file);
+  const resumed = await resumableUpload(file);
+  const planner = partPlanner(file.size, resumed || undefined);
+  let init = null;
+  let record;
+  if (resumed) {
+    record = resumed.saved;
+    updateFileStatus(fileIndex, 'uploading', `Resuming (${resumed.done.length} parts already uploaded)...`);
+  } else {
+    init = await initiateMultipart(file.name, file.type || 'application/octet-stream', planner.estimate());
+    record = { key: init.key, uploadId: init.uploadId, parts: {} };
+  }
+  const { key, uploadId } = record;
+  upload.key = key;
+  upload.uploadId = uploadId;
+  const save = () => resumeStore('put', { ...record, savedAt: Date.now() }, fingerprint);
+  await save();
+  
+  const partUrl = partUrlCache(key, uploadId, () => planner.estimate(), init);
+  const loaded = {};
+  // Bytes in flight count too, so progress moves smoothly with parallel parts
+  const reportProgress = () => reportFileProgress(fileIndex, Object.values(loaded).reduce((a, b) => a + b, 0), file.size);
+
+  const etags = [];
+  const redo = resumed ? resumed.redo : [];
+  if (resumed) {
+    resumed.done.forEach(p => {
+      etags.push({ ETag: p.etag, PartNumber: p.partNumber });
+      loaded[p.partNumber] = p.end - p.start;
+    });
+    reportProgress();
+  }
+  const nextPart = () => {
+    if (redo.length) return redo.shift();
+    const part = planner.next();
+    if (part) {
+      // Remember the byte range behind each part number before sending it
+      record.parts[part.partNumber] = { start: part.start, end: part.end };
+      save();
+    }
+    return part;
+  };
+
+  // Each stream takes the next part as it frees up, sized from the latest speed
+  const sendParts = async () => {
+    for (let part = nextPart(); part; part = nextPart()) {
+      const bytes = part.end - part.start;
+      const { etag, seconds } = await putPartWithRetry(partUrl, part.partNumber, file.slice(part.start, part.end), (sent) => {
+        loaded[part.partNumber] = sent;
+        reportProgress();
+      }, upload);
+      planner.measured(bytes, seconds);
+      loaded[part.partNumber] = bytes;
+      reportProgress();
+      etags.push({ ETag: etag, PartNumber: part.partNumber });
+    }
+  };
+  await Promise.all(Array.from({ length: PART_CONCURRENCY }, sendParts)).catch((error) => {
+    // One part gave up: stop the rest of this file instead of sending them anyway
+    upload.failed = true;
+    upload.requests.forEach(xhr => xhr.abort());
+    throw error;
+  });
+
+  await completeMultipart(key, uploadId, etags);
+  resumeStore('delete', fingerprint);
+}
+
 function initializeMultiFileProcessing(files) {
   if (files.length === 1) {
     // Single file - use enhanced single file display with filename
@@ -868,9 +1350,15 @@ function initializeSingleFileProcessing(file) {
   byId('processingDownload').classList.remove('hidden');
 }
 
+// The held status request in flight; aborted when another file starts
+// converting, so the poll restarts with that file's key instead of waiting out the hold
+let statusPoll = null;
+
 function updateFileStatus(fileIndex, status, message) {
   const upload = window.__activeUploads[fileIndex];
+  const started = status === 'processing' && upload.status !== 'processing';
   upload.status = status;
+  if (started && statusPoll) statusPoll.abort();
   
   const statusEl = byId(`fileStatusText${fileIndex}`);
   if (statusEl) {
@@ -907,69 +1395,92 @@ function showFileDownload(fileIndex, downloadUrl, filename) {
 }
 
 async function pollAllFiles() {
-  const maxMs = 15 * 60 * 1000; // 15 minutes total
-  const intervalMs = 3000; // 3 seconds
-  const pollStart = Date.now();
+  const maxMs = 15 * 60 * 1000; // 15 minutes after the last upload finished
+  const intervalMs = 3000; // fallback after a failed request
+  let pollStart = Date.now();
   
   while (Date.now() - pollStart < maxMs) {
+    if (window.__cancelled) return;
     let allCompleted = true;
     
-    for (let i = 0; i < window.__activeUploads.length; i++) {
+    const pending = [];
+    window.__activeUploads.forEach((upload, i) => {
+      if (upload.status === 'pending' || upload.status === 'uploading') pollStart = Date.now();
+      if (upload.status === 'processing' || upload.status === 'uploading' || upload.status === 'pending') {
+        allCompleted = false;
+        if (upload.key && upload.status === 'processing') pending.push(i);
+      }
+    });
+    
+    // One (held) request per cycle for every file still converting
+    let statuses = {};
+    let delayMs = intervalMs;
+    if (pending.length) {
+      statusPoll = new AbortController();
+      try {
+        const result = await checkStatuses(pending.map(i => window.__activeUploads[i].key), 10, statusPoll.signal);
+        statuses = result.statuses;
+        delayMs = result.retryAfter * 1000;
+      } catch (error) {
+        if (error.name === 'AbortError') delayMs = 0;
+        else console.error('Failed to check status:', error);
+      } finally {
+        statusPoll = null;
+      }
+    }
+    if (window.__cancelled) return;
+    
+    for (const i of pending) {
       const upload = window.__activeUploads[i];
+      const status = statuses[upload.key];
+      if (!status) continue;
       
-      if (upload.status === 'processing' || upload.status === 'uploading') {
-        allCompleted = false;
+      if (status.phase) {
+        updateFileStatus(i, 'processing', `Processing (${status.phase})...`);
+      }
+      if (status.failed) {
+        updateFileStatus(i, 'failed', status.error || 'Conversion failed');
         
-        if (upload.key && upload.status === 'processing') {
-          try {
-            const status = await checkStatus(upload.key);
-            
-            if (status.failed) {
-              updateFileStatus(i, 'failed', status.error || 'Conversion failed');
-              
-              // For single file, update main UI
-              if (window.__selectedFiles.length === 1) {
-                byId('progressFill').classList.remove('animated');
-                byId('percent').classList.remove('hidden');
-                setStatus(status.error || 'Conversion failed', 'error');
-                byId('convert').disabled = false;
-                showScreen('start');
-                return;
-              }
-            } else if (status.ready) {
-              const filename = getDownloadFilename(status);
-              upload.downloadUrl = status.url;
-              showFileDownload(i, status.url, filename);
-              
-              // For single file, update main download button
-              if (window.__selectedFiles.length === 1) {
-                byId('progressFill').classList.remove('animated');
-                byId('percent').classList.remove('hidden');
-                setStatus('Done', 'success');
-                setProgress(100);
-                const dlBtn = byId('processingDownload');
-                dlBtn.disabled = false;
-                dlBtn.onclick = () => { window.location.href = status.url; };
-                dlBtn.textContent = 'Download';
-                const cmBtn = byId('convertMore');
-                if (cmBtn) {
-                  cmBtn.classList.remove('hidden');
-                  cmBtn.onclick = () => { window.open('/', '_blank'); };
-                }
-              }
-            }
-          } catch (error) {
-            console.error(`Failed to check status for file ${i}:`, error);
+        // For single file, update main UI
+        if (window.__selectedFiles.length === 1) {
+          byId('progressFill').classList.remove('animated');
+          byId('percent').classList.remove('hidden');
+          setStatus(status.error || 'Conversion failed', 'error');
+          byId('convert').disabled = false;
+          showScreen('start');
+          return;
+        }
+      } else if (status.ready) {
+        const filename = getDownloadFilename(status);
+        upload.downloadUrl = status.url;
+        showFileDownload(i, status.url, filename);
+        
+        // For single file, update main download button
+        if (window.__selectedFiles.length === 1) {
+          byId('progressFill').classList.remove('animated');
+          byId('percent').classList.remove('hidden');
+          setStatus('Done', 'success');
+          setProgress(100);
+          const dlBtn = byId('processingDownload');
+          dlBtn.disabled = false;
+          dlBtn.onclick = () => { window.location.href = status.url; };
+          dlBtn.textContent = 'Download';
+          const cmBtn = byId('convertMore');
+          if (cmBtn) {
+            cmBtn.classList.remove('hidden');
+            cmBtn.onclick = () => { window.open('/', '_blank'); };
           }
+          byId('retargetRow').classList.remove('hidden');
         }
       }
     }
     
     if (allCompleted) {
+      byId('cancelJobs').classList.add('hidden');
       break;
     }
     
-    await new Promise(r => setTimeout(r, intervalMs));
+    if (delayMs) await new Promise(r => setTimeout(r, delayMs));
   }
   
   // Check for any files that timed out
@@ -1002,6 +1513,14 @@ fileInput.addEventListener('change', () => {
   }
 });
 
+byId('retarget').addEventListener('click', () => {
+  retargetSingle().catch(err => setStatus(err && err.message ? err.message : String(err), 'error'));
+});
+
+byId('cancelJobs').addEventListener('click', () => {
+  cancelAll().catch(err => console.error('Cancel failed:', err));
+});
+
 byId('convert').addEventListener('click', () => {
   uploadAndProcess().catch(err => {
     setStatus(err && err.message ? err.message : String(err), 'error');
@@ -1014,6 +1533,17 @@ byId('convert').addEventListener('click', () => {
 </html>
 """
 
+###############################################################################
+
+def _precompress(html: str) -> tuple[str, dict[str, bytes]]:
+	# Done once at import: every warm request just picks a ready-made body
+	raw = html.encode("utf-8")
+	bodies = {"identity": raw, "gzip": gzip.compress(raw, 9, mtime=0)}
+	return hashlib.sha256(raw).hexdigest()[:20], bodies
+
+
+INDEX_HASH, INDEX_BODIES = _precompress(INDEX_HTML)
+
 
 def _response(status_code, body, content_type="application/json"):
 	if isinstance(body, (dict, list)):
@@ -1029,26 +1559,9 @@ def _response(status_code, body, content_type="application/json"):
 
 ###############################################################################
 
-def _write_status(upload_key: str, state: str, extra: dict | None = None):
-	table = dynamodb.Table(DYNAMO_TABLE)
-	payload = {
-		"upload_key": upload_key,
-		"state": state,
-		"source": upload_key,
-		"updated_at": int(time.time()),
-		"ttl": int(time.time()) + (7 * 24 * 60 * 60)  # 7 days TTL
-	}
-	if extra:
-		payload.update(extra)
-	table.put_item(Item=payload)
-
-###############################################################################
-
 def _get_status(upload_key: str) -> dict | None:
-	table = dynamodb.Table(DYNAMO_TABLE)
 	try:
-		response = table.get_item(Key={"upload_key": upload_key})
-		return response.get("Item")
+		return status.get(upload_key)
 	except Exception:
 		return None
 
@@ -1074,8 +1587,37 @@ def _get_method_path(event):
 
 ###############################################################################
 
-def _handle_index():
-	return _response(200, INDEX_HTML, content_type="text/html; charset=utf-8")
+def _accepted_encodings(header: str) -> set[str]:
+	accepted = set()
+	for item in header.split(","):
+		name, _, params = item.strip().partition(";")
+		q = params.strip()
+		if q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+			continue
+		accepted.add(name.strip().lower())
+	return accepted
+
+
+def _handle_index(event):
+	headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+	accepted = _accepted_encodings(headers.get("accept-encoding", ""))
+	encoding = "gzip" if "gzip" in accepted or "*" in accepted else "identity"
+	# Strong ETag per representation; any of them proves the client has this version
+	etag = f'"{INDEX_HASH}"' if encoding == "identity" else f'"{INDEX_HASH}-{encoding}"'
+	response_headers = {
+		"Content-Type": "text/html; charset=utf-8",
+		"Cache-Control": INDEX_CACHE_CONTROL,
+		"ETag": etag,
+		"Vary": "Accept-Encoding",
+	}
+	if_none_match = headers.get("if-none-match", "")
+	if if_none_match.strip() == "*" or INDEX_HASH in if_none_match:
+		return {"statusCode": 304, "headers": response_headers, "body": ""}
+	body = INDEX_BODIES[encoding]
+	if encoding == "identity":
+		return {"statusCode": 200, "headers": response_headers, "body": body.decode("utf-8")}
+	response_headers["Content-Encoding"] = encoding
+	return {"statusCode": 200, "headers": response_headers, "body": base64.b64encode(body).decode("ascii"), "isBase64Encoded": True}
 
 ###############################################################################
 
@@ -1085,12 +1627,71 @@ def _handle_initiate(event):
 	content_type = data.get("contentType", "application/octet-stream")
 	if not filename:
 		return _response(400, {"error": "filename is required"})
-	# Create upload key preserving filename in a unique directory
-	uid = uuid.uuid4()
-	key = f"uploads/{uid}/{filename}"
+	try:
+		parts = int(data.get("parts") or 0)
+	except (TypeError, ValueError):
+		return _response(400, {"error": "parts must be an integer"})
+	key = _new_upload_key(filename)
 	create = s3.create_multipart_upload(Bucket=BUCKET_NAME, Key=key, ContentType=content_type)
 	upload_id = create["UploadId"]
-	return _response(200, {"uploadId": upload_id, "key": key})
+	result = {"uploadId": upload_id, "key": key}
+	# Hand out the first batch of part URLs up front to save a round trip per part
+	if parts > 0:
+		result.update(_part_urls(key, upload_id, 1, parts))
+	return _response(200, result)
+
+###############################################################################
+
+def _new_upload_key(filename: str) -> str:
+	# Create upload key preserving filename in a unique directory
+	uid = uuid.uuid4()
+	return f"uploads/{uid}/{filename}"
+
+###############################################################################
+
+def _handle_upload(event):
+	"""
+	One presigned PUT for a small file: no initiate/part/complete round trips,
+	and the converter fires on ObjectCreated:Put as soon as it lands. The
+	declared size is signed as Content-Length, so S3 rejects any other body.
+	"""
+	data = _parse_json_body(event)
+	filename = data.get("filename")
+	content_type = data.get("contentType") or "application/octet-stream"
+	if not filename:
+		return _response(400, {"error": "filename is required"})
+	try:
+		size = int(data.get("size"))
+	except (TypeError, ValueError):
+		return _response(400, {"error": "size is required"})
+	if not 0 < size <= SINGLE_PUT_MAX_BYTES:
+		return _response(400, {"error": f"single uploads must be 1 to {SINGLE_PUT_MAX_BYTES} bytes; use multipart"})
+	key = _new_upload_key(filename)
+	url = s3.generate_presigned_url(
+		ClientMethod="put_object",
+		Params={"Bucket": BUCKET_NAME, "Key": key, "ContentType": content_type, "ContentLength": size},
+		ExpiresIn=PART_URL_EXPIRES_SECONDS,
+	)
+	return _response(200, {"key": key, "url": url, "contentType": content_type, "size": size})
+
+###############################################################################
+
+def _part_urls(key: str, upload_id: str, start: int, count: int) -> dict:
+	# generate_presigned_url only signs; it makes no S3 request
+	end = min(start + min(count, MAX_PART_URLS), S3_MAX_PARTS + 1)
+	urls = {}
+	for part_number in range(start, end):
+		urls[str(part_number)] = s3.generate_presigned_url(
+			ClientMethod="upload_part",
+			Params={
+				"Bucket": BUCKET_NAME,
+				"Key": key,
+				"UploadId": upload_id,
+				"PartNumber": part_number,
+			},
+			ExpiresIn=PART_URL_EXPIRES_SECONDS,
+		)
+	return {"urls": urls, "expiresIn": PART_URL_EXPIRES_SECONDS}
 
 ###############################################################################
 
@@ -1116,6 +1717,49 @@ def _handle_part_url(event):
 
 ###############################################################################
 
+def _handle_part_urls(event):
+	params = event.get("queryStringParameters") or {}
+	key = params.get("key")
+	upload_id = params.get("uploadId")
+	if not key or not upload_id:
+		return _response(400, {"error": "key and uploadId are required"})
+	try:
+		start = int(params.get("start") or 1)
+		count = int(params.get("count") or MAX_PART_URLS)
+	except ValueError:
+		return _response(400, {"error": "start and count must be integers"})
+	if not 1 <= start <= S3_MAX_PARTS or count < 1:
+		return _response(400, {"error": f"start must be between 1 and {S3_MAX_PARTS} and count positive"})
+	return _response(200, _part_urls(key, upload_id, start, count))
+
+###############################################################################
+
+def _handle_list_parts(event):
+	"""
+	Parts S3 already holds for an unfinished upload, so a client that lost
+	its connection (or the page) only re-sends what is missing.
+	"""
+	params = event.get("queryStringParameters") or {}
+	key = params.get("key")
+	upload_id = params.get("uploadId")
+	if not key or not key.startswith("uploads/") or not upload_id:
+		return _response(400, {"error": "key and uploadId are required"})
+	parts = []
+	kwargs = {"Bucket": BUCKET_NAME, "Key": key, "UploadId": upload_id}
+	try:
+		while True:
+			page = s3.list_parts(**kwargs)
+			for part in page.get("Parts", []):
+				parts.append({"PartNumber": part["PartNumber"], "ETag": part["ETag"], "Size": part["Size"]})
+			if not page.get("IsTruncated"):
+				break
+			kwargs["PartNumberMarker"] = page["NextPartNumberMarker"]
+	except s3.exceptions.NoSuchUpload:
+		return _response(404, {"error": "Unknown or finished upload"})
+	return _response(200, {"parts": parts})
+
+###############################################################################
+
 def _handle_complete(event):
 	data = _parse_json_body(event)
 	key = data.get("key")
@@ -1131,69 +1775,258 @@ def _handle_complete(event):
 		MultipartUpload={"Parts": parts_sorted},
 		UploadId=upload_id,
 	)
-	# Record processing state so the client can display progress while Lambda runs
-	_write_status(key, "processing", {"message": "awaiting conversion"})
+	# Record queued state so the client can display progress until the converter
+	# picks it up; if it already has, this is a no-op rather than a step back
+	status.transition(key, "queued", {"message": "awaiting conversion"})
 	return _response(200, result)
 
 ###############################################################################
 
-def _handle_status(event):
+def _handle_cancel(event):
+	data = _parse_json_body(event)
+	key = data.get("key")
+	upload_id = data.get("uploadId")
+	# Only job records; lease and rollup items share the table
+	if not key or not key.startswith("uploads/"):
+		return _response(400, {"error": "key of an upload is required"})
+	if upload_id:
+		# Drop any parts already sent for an upload that never completed
+		try:
+			s3.abort_multipart_upload(Bucket=BUCKET_NAME, Key=key, UploadId=upload_id)
+		except Exception:
+			pass
+	# The converter polls for this state and stops; finished jobs are left alone
+	if not status.transition(key, "cancelled", {"message": "cancelled by user"}):
+		return _response(200, {"cancelled": False, "reason": "already finished"})
+	return _response(200, {"cancelled": True})
+
+###############################################################################
+
+def _handle_retarget(event):
+	data = _parse_json_body(event)
+	key = data.get("key")
+	if not key or not key.startswith("uploads/"):
+		return _response(400, {"error": "key of an existing upload is required"})
+	if not _get_status(key):
+		return _response(404, {"error": "Unknown upload"})
+
+	options = {}
+	if data.get("targetBytes") is not None:
+		try:
+			target = int(data["targetBytes"])
+		except (TypeError, ValueError):
+			return _response(400, {"error": "targetBytes must be an integer"})
+		if not MIN_TARGET_BYTES <= target <= MAX_TARGET_BYTES:
+			return _response(400, {"error": f"targetBytes must be between {MIN_TARGET_BYTES} and {MAX_TARGET_BYTES}"})
+		options["targetBytes"] = target
+	if data.get("format") is not None:
+		if data["format"] not in RETARGET_FORMATS:
+			return _response(400, {"error": f"format must be one of {sorted(RETARGET_FORMATS)}"})
+		options["format"] = data["format"]
+	if data.get("trim") is not None:
+		trim = data["trim"]
+		try:
+			start = float(trim.get("start") or 0)
+			end = float(trim["end"]) if trim.get("end") is not None else None
+		except (AttributeError, TypeError, ValueError):
+			return _response(400, {"error": "trim must be {start, end} in seconds"})
+		if start < 0 or (end is not None and end <= start):
+			return _response(400, {"error": "trim must satisfy 0 <= start < end"})
+		options["trim"] = {"start": start, "end": end}
+	if data.get("profile") is not None:
+		if not isinstance(data["profile"], bool):
+			return _response(400, {"error": "profile must be true or false"})
+		options["profile"] = data["profile"]
+
+	# The converter reuses the stored source and its saved analysis, so no upload
+	job_key = f"{key}#{uuid.uuid4().hex[:12]}"
+	status.transition(job_key, "queued", {"message": "awaiting conversion", "source": key})
+	lambda_client.invoke(
+		FunctionName=CONVERTER_FUNCTION,
+		InvocationType="Event",
+		Payload=json.dumps({"retarget": {"key": key, "jobKey": job_key, "options": options, "requestedAt": time.time()}}).encode(),
+	)
+	return _response(200, {"key": job_key})
+
+###############################################################################
+
+def _download_url(record: dict) -> tuple[str, float]:
+	"""
+	The stored download URL while it has some life left, otherwise a fresh
+	one. Presigning is local signing work; it never calls S3.
+	"""
+	url = record.get("url")
+	expires = float(record.get("urlExpires") or 0)
+	if url and expires - time.time() > URL_REFRESH_MARGIN:
+		return url, expires
+	out_key = record["output"]
+	url = s3.generate_presigned_url(
+		ClientMethod="get_object",
+		Params={
+			"Bucket": BUCKET_NAME,
+			"Key": out_key,
+			"ResponseContentDisposition": f"attachment; filename=\"{os.path.basename(out_key)}\"",
+		},
+		ExpiresIn=URL_EXPIRES_SECONDS,
+	)
+	return url, time.time() + URL_EXPIRES_SECONDS
+
+
+def _remember(key: str, body: dict, until: float) -> dict:
+	# Completed and cancelled jobs never change, so a warm container can answer
+	# repeats itself; failures are not cached, a retry may still restart them
+	_finished_cache[key] = (until, body)
+	_finished_cache.move_to_end(key)
+	while len(_finished_cache) > FINISHED_CACHE_SIZE:
+		_finished_cache.popitem(last=False)
+	return body
+
+###############################################################################
+
+def _status_body(key: str, record: dict | None) -> dict:
+	if not record:
+		return {"ready": False}
+
+	state = record.get("state")
+	if state == "failure":
+		return {"ready": False, "failed": True, "error": record.get("error")}
+	if state in ("queued", "processing"):
+		return {"ready": False, "state": "processing", "phase": record.get("ph")}
+	if state == "cancelled":
+		return _remember(key, {"ready": False, "failed": True, "cancelled": True, "error": "Cancelled"}, time.time() + FINISHED_CACHE_SECONDS)
+	if state == "completed":
+		out_key = record.get("output")
+		if not out_key:
+			return {"ready": False, "failed": True, "error": "Output file not found"}
+		# The converter recorded size, type and a presigned URL; no S3 calls here
+		url, url_expires = _download_url(record)
+		return _remember(key, {
+			"ready": True,
+			"outputKey": out_key,
+			"contentType": record.get("outputType"),
+			"size": int(record.get("outputSize") or 0),
+			"url": url,
+		}, url_expires - URL_REFRESH_MARGIN)
+
+	# Unknown state
+	return {"ready": False}
+
+
+def _cached_status(key: str) -> dict | None:
+	cached = _finished_cache.get(key)
+	if cached and cached[0] > time.time():
+		return cached[1]
+	return None
+
+###############################################################################
+
+def _wait_seconds(raw, context) -> float:
+	try:
+		wait = min(float(raw or 0), MAX_WAIT_SECONDS)
+	except (TypeError, ValueError):
+		return 0.0
+	if context is not None:
+		# Leave time to answer before the function itself times out
+		wait = min(wait, context.get_remaining_time_in_millis() / 1000 - 3)
+	return max(wait, 0.0)
+
+
+def _long_poll(read, wait: float) -> dict[str, dict]:
+	"""
+	Call `read()` (key -> status response) until a job has finished or any
+	response differs from the first read, or `wait` seconds have passed.
+	"""
+	deadline = time.monotonic() + wait
+	first = current = read()
+	if any(body.get("ready") or body.get("failed") for body in first.values()):
+		return first
+	delay = LONG_POLL_INTERVAL
+	while current == first and time.monotonic() + delay < deadline:
+		time.sleep(delay)
+		delay = min(delay * 1.5, LONG_POLL_MAX_INTERVAL)
+		current = read()
+	return current
+
+
+def _retry_after(wait: float) -> int:
+	# After a held request the client can ask again straight away
+	return 0 if wait else POLL_INTERVAL_SECONDS
+
+###############################################################################
+
+def _handle_status(event, context=None):
 	params = event.get("queryStringParameters") or {}
 	key = params.get("key")
 	if not key:
 		return _response(400, {"error": "key is required"})
 
-	# Get status from DynamoDB
-	status_payload = _get_status(key)
-	if not status_payload:
-		return _response(200, {"ready": False})
+	def read():
+		cached = _cached_status(key)
+		return {key: cached if cached else _status_body(key, _get_status(key))}
 
-	state = status_payload.get("state")
-	if state == "failure":
-		return _response(200, {"ready": False, "failed": True, "error": status_payload.get("error")})
-	if state == "processing":
-		return _response(200, {"ready": False, "state": "processing"})
-	if state == "completed":
-		out_key = status_payload.get("output")
-		if out_key:
+	wait = _wait_seconds(params.get("wait"), context)
+	body = _long_poll(read, wait)[key]
+	return _response(200, {**body, "retryAfter": _retry_after(wait)})
+
+###############################################################################
+
+def _handle_status_batch(event, context=None):
+	data = _parse_json_body(event)
+	keys = data.get("keys")
+	if not isinstance(keys, list) or not keys or not all(isinstance(k, str) and k for k in keys):
+		return _response(400, {"error": "keys must be a non-empty list of upload keys"})
+	if len(keys) > MAX_STATUS_KEYS:
+		return _response(400, {"error": f"at most {MAX_STATUS_KEYS} keys per request"})
+
+	def read():
+		statuses = {}
+		for key in keys:
+			cached = _cached_status(key)
+			if cached:
+				statuses[key] = cached
+		missing = [key for key in keys if key not in statuses]
+		if missing:
+			# One BatchGetItem for everything still in flight
 			try:
-				head = s3.head_object(Bucket=BUCKET_NAME, Key=out_key)
-				basename = os.path.basename(out_key)
-				url = s3.generate_presigned_url(
-					ClientMethod="get_object",
-					Params={
-						"Bucket": BUCKET_NAME,
-						"Key": out_key,
-						"ResponseContentDisposition": f"attachment; filename=\"{basename}\"",
-					},
-					ExpiresIn=3600,
-				)
-				return _response(200, {
-					"ready": True,
-					"outputKey": out_key,
-					"contentType": head.get("ContentType"),
-					"size": int(head.get("ContentLength") or 0),
-					"url": url,
-				})
+				records = status.get_many(missing, STATUS_ATTRIBUTES)
 			except Exception:
-				# If for some reason the output isn't there, return error
-				return _response(200, {"ready": False, "failed": True, "error": "Output file not found"})
+				records = {}
+			for key in missing:
+				statuses[key] = _status_body(key, records.get(key))
+		return statuses
 
-	# Unknown state
-	return _response(200, {"ready": False})
+	wait = _wait_seconds(data.get("wait"), context)
+	return _response(200, {"statuses": _long_poll(read, wait), "retryAfter": _retry_after(wait)})
 
 ###############################################################################
 
 def handle(event, context):
+	runtime.report_startup()
 	method, path = _get_method_path(event)
 	if method == "GET" and path == "/":
-		return _handle_index()
+		return _handle_index(event)
+	if method == "POST" and path == "/api/upload":
+		return _handle_upload(event)
 	if method == "POST" and path == "/api/multipart/initiate":
 		return _handle_initiate(event)
 	if method == "GET" and path == "/api/multipart/url":
 		return _handle_part_url(event)
+	if method == "GET" and path == "/api/multipart/urls":
+		return _handle_part_urls(event)
+	if method == "GET" and path == "/api/multipart/parts":
+		return _handle_list_parts(event)
 	if method == "POST" and path == "/api/multipart/complete":
 		return _handle_complete(event)
 	if method == "GET" and path == "/api/status":
-		return _handle_status(event)
+		return _handle_status(event, context)
+	if method == "POST" and path == "/api/status":
+		return _handle_status_batch(event, context)
+	if method == "POST" and path == "/api/cancel":
+		return _handle_cancel(event)
+	if method == "POST" and path == "/api/retarget":
+		return _handle_retarget(event)
 	return _response(404, {"error": "Not Found"})
+
+###############################################################################
+
+runtime.module_loaded(__name__, _IMPORT_STARTED)
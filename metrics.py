@@ -0,0 +1,108 @@
+"""
+Per-stage timings for one conversion job.
+
+The converter opens a `JobMetrics` per job and wraps each stage in
+`stage(name)` (download, probe, decode, upload) or `encode_pass()`. The
+summary is stored on the job's status record under `metrics` (the media type
+plus whole numbers, which map straight onto DynamoDB numbers) and printed as
+one CloudWatch Embedded Metric Format line, which CloudWatch turns into
+metrics in the `compress5mb` namespace without any extra API calls:
+
+    {"_aws": {...}, "outcome": "completed", "media": "video", "totalMs": 41230, "downloadMs": 812, ...}
+
+Peak RSS comes from getrusage, so it is the container's peak so far: on a
+warm container it can reflect an earlier, larger job.
+"""
+
+import json
+import time
+import resource
+from contextlib import contextmanager
+from datetime import datetime
+
+NAMESPACE = "compress5mb"
+
+# Stage timings as <stage>Ms; queue delay is only known for S3 events and re-targets
+_STAGES = ("download", "probe", "decode", "encode", "upload")
+
+###############################################################################
+
+def event_time(iso: str | None) -> float | None:
+	"""Epoch seconds for an S3 event's eventTime ("2025-09-07T12:00:00.123Z")."""
+	if not iso:
+		return None
+	try:
+		return datetime.fromisoformat(iso.replace("Z", "+00:00")).timestamp()
+	except ValueError:
+		return None
+
+
+def _peak_rss_mb(who: int) -> int:
+	# ru_maxrss is in KiB on Linux
+	return resource.getrusage(who).ru_maxrss // 1024
+
+###############################################################################
+
+class JobMetrics:
+	def __init__(self, queued_at: float | None = None):
+		self._started = time.perf_counter()
+		self.queue_delay = max(0.0, time.time() - queued_at) if queued_at else None
+		self.seconds: dict[str, float] = {}
+		self.passes: list[float] = []
+		self.media: str | None = None
+		self.bytes_in = 0
+		self.bytes_out = 0
+
+	@contextmanager
+	def stage(self, name: str):
+		started = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - started
+
+	@contextmanager
+	def encode_pass(self):
+		started = time.perf_counter()
+		try:
+			with self.stage("encode"):
+				yield
+		finally:
+			self.passes.append(time.perf_counter() - started)
+
+	def summary(self) -> dict:
+		out = {"media": self.media or "unknown", "totalMs": int((time.perf_counter() - self._started) * 1000)}
+		if self.queue_delay is not None:
+			out["queueDelayMs"] = int(self.queue_delay * 1000)
+		for name in _STAGES:
+			if name in self.seconds:
+				out[f"{name}Ms"] = int(self.seconds[name] * 1000)
+		out["passMs"] = [int(s * 1000) for s in self.passes]
+		out["passes"] = len(self.passes)
+		out["bytesIn"] = self.bytes_in
+		out["bytesOut"] = self.bytes_out
+		out["peakRssMb"] = _peak_rss_mb(resource.RUSAGE_SELF)
+		# ffmpeg, ImageMagick and friends run as children
+		out["childPeakRssMb"] = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+		return out
+
+	def emit(self, outcome: str) -> dict:
+		"""Print the EMF metric line for this job and return the summary."""
+		summary = self.summary()
+		values = {k: v for k, v in summary.items() if k not in ("media", "passMs")}
+		units = {k: "Milliseconds" if k.endswith("Ms") else "Bytes" if k.startswith("bytes") else "Megabytes" if k.endswith("Mb") else "Count" for k in values}
+		print(json.dumps({
+			"_aws": {
+				"Timestamp": int(time.time() * 1000),
+				"CloudWatchMetrics": [{
+					"Namespace": NAMESPACE,
+					"Dimensions": [["outcome", "media"]],
+					"Metrics": [{"Name": k, "Unit": unit} for k, unit in units.items()],
+				}],
+			},
+			"outcome": outcome,
+			"media": summary["media"],
+			**values,
+			"passMs": summary["passMs"],
+		}))
+		return summary
@@ -0,0 +1,177 @@
+"""
+Subprocess runner with bounded, structured logging.
+
+ffmpeg and the image tools can write megabytes of per-frame stats over a long
+encode. `run` drains stdout and stderr as they arrive instead of buffering
+them, keeps only the last TAIL_LINES lines of each (ffmpeg's "\\r" progress
+updates are parsed into stats, not kept), and logs compact `proc` JSON lines,
+so log volume no longer grows with video length:
+
+    {"proc": {"event": "start", "name": "ffmpeg", "cmd": "ffmpeg -y -i ..."}}
+    {"proc": {"event": "exit", "name": "ffmpeg", "code": 0, "seconds": 41.2, "lines": 37, "frame": "7200", "speed": "4.1x", ...}}
+
+A failure logs the stderr tail once, at ERROR. PROCESS_LOG sets verbosity:
+quiet (failures only), summary (default: start and exit), progress (plus the
+latest stats every PROGRESS_SECONDS) or full (every output line).
+
+While a job is profiled (profiling.py sets `profiler`), ffmpeg also runs with
+-benchmark/-benchmark_all; its "bench:" lines are summed per operation as they
+arrive and every command is reported to the profiler.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+import subprocess
+from collections import deque
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+_LEVELS = {"quiet": 0, "summary": 1, "progress": 2, "full": 3}
+LOG_LEVEL = _LEVELS.get(os.environ.get("PROCESS_LOG", "summary"), 1)
+
+TAIL_LINES = 40
+PROGRESS_SECONDS = 10
+# A "line" longer than this is cut, so output without newlines cannot grow a buffer
+_MAX_LINE = 64 * 1024
+
+# Called every POLL_SECONDS while a subprocess runs; if it raises, the
+# process is killed and the exception propagates (used for job cancellation)
+poll_hook: Callable[[], None] | None = None
+POLL_SECONDS = 5
+
+# Set by profiling.Profile for the duration of a profiled job
+profiler = None
+
+# "frame= 7200 fps=171 q=28.0 size=  4096kB time=00:04:00.00 bitrate= 139.8kbits/s speed=4.1x"
+_STATS = re.compile(r"(frame|fps|size|time|bitrate|speed)=\s*(\S+)")
+_NEWLINES = re.compile(rb"[\r\n]")
+# -benchmark: "bench: utime=1.234s stime=0.056s rtime=0.789s" and "bench: maxrss=123456KiB"
+_BENCH_TOTAL = re.compile(r"(utime|stime|rtime|maxrss)=([\d.]+)")
+# -benchmark_all: "bench:     1234 user      56 sys     1300 real encode_video 0.0" (microseconds)
+_BENCH_OP = re.compile(r"bench:\s*(\d+) user\s*(\d+) sys\s*(\d+) real (\S+)")
+
+###############################################################################
+
+class _Benchmark:
+	"""Running totals of ffmpeg's bench lines; constant memory however long the encode."""
+
+	def __init__(self):
+		self.totals: dict[str, float] = {}
+		self.ops: dict[str, dict[str, int]] = {}
+
+	def add(self, line: str):
+		match = _BENCH_OP.match(line)
+		if match:
+			user, system, real, op = match.groups()
+			totals = self.ops.setdefault(op, {"count": 0, "userUs": 0, "sysUs": 0, "realUs": 0})
+			totals["count"] += 1
+			totals["userUs"] += int(user)
+			totals["sysUs"] += int(system)
+			totals["realUs"] += int(real)
+			return
+		self.totals.update((key, float(value)) for key, value in _BENCH_TOTAL.findall(line))
+
+	def summary(self) -> dict:
+		return {"totals": self.totals, "ops": self.ops}
+
+###############################################################################
+
+def _log(level: int, payload: dict):
+	if LOG_LEVEL >= level:
+		logger.info(json.dumps({"proc": payload}))
+
+
+class _Reader(threading.Thread):
+	"""Drain one pipe, keeping a bounded tail and the latest ffmpeg stats."""
+
+	def __init__(self, pipe, name: str, bench: _Benchmark | None = None):
+		super().__init__(daemon=True)
+		self.pipe = pipe
+		self.name = name
+		self.bench = bench
+		self.tail: deque[str] = deque(maxlen=TAIL_LINES)
+		self.stats: dict[str, str] = {}
+		self.lines = 0
+
+	def run(self):
+		pending = b""
+		for chunk in iter(lambda: self.pipe.read1(65536), b""):
+			*lines, pending = _NEWLINES.split(pending + chunk)
+			for line in lines:
+				self._line(line)
+			if len(pending) > _MAX_LINE:
+				self._line(pending)
+				pending = b""
+		self._line(pending)
+		self.pipe.close()
+
+	def _line(self, raw: bytes):
+		line = raw.decode("utf-8", "replace").strip()
+		if not line:
+			return
+		self.lines += 1
+		if self.bench is not None and line.startswith("bench:"):
+			self.bench.add(line)
+			return
+		stats = _STATS.findall(line)
+		if len(stats) >= 2:
+			self.stats.update(stats)
+			return
+		self.tail.append(line)
+		_log(_LEVELS["full"], {"name": self.name, "line": line})
+
+###############################################################################
+
+def run(cmd: list[str], check: bool = False) -> subprocess.CompletedProcess:
+	"""
+	Run `cmd` like subprocess.run with captured output, except that
+	`stdout`/`stderr` hold only the last TAIL_LINES lines of each.
+	"""
+	name = os.path.basename(cmd[0])
+	active = profiler
+	bench = None
+	if active is not None and name == "ffmpeg":
+		cmd = [cmd[0], "-benchmark", "-benchmark_all", *cmd[1:]]
+		bench = _Benchmark()
+	started = time.perf_counter()
+	_log(_LEVELS["summary"], {"event": "start", "name": name, "cmd": " ".join(cmd)})
+	proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	out, err = _Reader(proc.stdout, name), _Reader(proc.stderr, name, bench)
+	out.start()
+	err.start()
+	last_progress = started
+	try:
+		while True:
+			try:
+				proc.wait(timeout=POLL_SECONDS)
+				break
+			except subprocess.TimeoutExpired:
+				if poll_hook:
+					poll_hook()
+				if LOG_LEVEL >= _LEVELS["progress"] and time.perf_counter() - last_progress >= PROGRESS_SECONDS:
+					last_progress = time.perf_counter()
+					_log(_LEVELS["progress"], {"event": "progress", "name": name, "seconds": round(last_progress - started, 1), **err.stats})
+	except BaseException:
+		proc.kill()
+		proc.wait()
+		raise
+	finally:
+		out.join()
+		err.join()
+
+	summary = {"event": "exit", "name": name, "code": proc.returncode, "seconds": round(time.perf_counter() - started, 2), "lines": out.lines + err.lines, **err.stats}
+	if proc.returncode != 0:
+		logger.error(json.dumps({"proc": {**summary, "cmd": " ".join(cmd), "tail": list(err.tail or out.tail)}}))
+	else:
+		_log(_LEVELS["summary"], summary)
+	if active is not None:
+		active.record_process({**summary, "cmd": cmd, "bench": bench.summary() if bench else None})
+	result = subprocess.CompletedProcess(cmd, proc.returncode, "\n".join(out.tail).encode(), "\n".join(err.tail).encode())
+	if check:
+		result.check_returncode()
+	return result
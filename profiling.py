@@ -0,0 +1,159 @@
+"""
+Opt-in deep profiling of one conversion.
+
+Off unless PROFILE_JOBS=1 is set on the converter or a re-target asks for it
+(`"profile": true`), and nothing here runs for unprofiled jobs. A profiled
+job gets:
+
+- cProfile of the converter's own Python code (main thread);
+- `-benchmark`/`-benchmark_all` for every ffmpeg run, summed per operation,
+  plus wall time and exit status of every subprocess (see processes.py);
+- CPU and RSS of the Lambda process and its live children, sampled every
+  SAMPLE_SECONDS from /proc.
+
+Everything is bundled into one `<output>.profile.tar.gz` next to the output
+(profile.json plus python.prof, which pstats or snakeviz can open).
+"""
+
+import io
+import os
+import json
+import time
+import pstats
+import tarfile
+import cProfile
+import tempfile
+import threading
+
+import processes
+
+ENABLED = os.environ.get("PROFILE_JOBS") == "1"
+
+SAMPLE_SECONDS = 0.5
+# 30 minutes at the default rate; a Lambda run is at most 15
+MAX_SAMPLES = 3600
+# Functions listed in profile.json, by cumulative time
+TOP_FUNCTIONS = 40
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+###############################################################################
+
+def _read(path: str) -> str:
+	try:
+		with open(path) as f:
+			return f.read()
+	except OSError:
+		return ""
+
+
+def _rss_mb(pid: int | str) -> float:
+	for line in _read(f"/proc/{pid}/status").splitlines():
+		if line.startswith("VmRSS:"):
+			return round(int(line.split()[1]) / 1024, 1)
+	return 0.0
+
+
+def _cpu_seconds(pid: int | str) -> float:
+	# Fields after the parenthesised command name; utime and stime are 14 and 15
+	fields = _read(f"/proc/{pid}/stat").rpartition(")")[2].split()
+	if len(fields) < 13:
+		return 0.0
+	return (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+
+
+def _children() -> list[str]:
+	pids = []
+	try:
+		tasks = os.listdir("/proc/self/task")
+	except OSError:
+		return pids
+	for task in tasks:
+		pids += _read(f"/proc/self/task/{task}/children").split()
+	return pids
+
+###############################################################################
+
+class _Sampler(threading.Thread):
+	def __init__(self):
+		super().__init__(daemon=True)
+		self.samples: list[dict] = []
+		self._done = threading.Event()
+
+	def run(self):
+		started = time.monotonic()
+		last_time = started
+		last_cpu: dict[str, float] = {"self": _cpu_seconds("self")}
+		while not self._done.wait(SAMPLE_SECONDS) and len(self.samples) < MAX_SAMPLES:
+			now = time.monotonic()
+			children = _children()
+			cpu = {"self": _cpu_seconds("self"), **{pid: _cpu_seconds(pid) for pid in children}}
+			# Percent of one core, process and children together
+			used = sum(seconds - last_cpu.get(pid, seconds) for pid, seconds in cpu.items())
+			self.samples.append({
+				"t": round(now - started, 2),
+				"cpuPct": round(100 * used / max(now - last_time, 1e-6), 1),
+				"rssMb": _rss_mb("self"),
+				"childRssMb": round(sum(_rss_mb(pid) for pid in children), 1),
+				"children": len(children),
+			})
+			last_time, last_cpu = now, cpu
+
+	def stop(self):
+		self._done.set()
+		self.join()
+
+###############################################################################
+
+class Profile:
+	def __init__(self, job_key: str):
+		self.job_key = job_key
+		self.meta: dict = {}
+		self.processes: list[dict] = []
+		self._profiler = cProfile.Profile()
+		self._sampler = _Sampler()
+		self._started = 0.0
+		self._seconds = 0.0
+
+	def start(self):
+		self._started = time.perf_counter()
+		processes.profiler = self
+		self._sampler.start()
+		self._profiler.enable()
+
+	def stop(self):
+		self._profiler.disable()
+		self._sampler.stop()
+		processes.profiler = None
+		self._seconds = time.perf_counter() - self._started
+
+	def record_process(self, summary: dict):
+		# Called from processes.run on the job's own thread
+		self.processes.append(summary)
+
+	def _python_top(self) -> str:
+		out = io.StringIO()
+		pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+		return out.getvalue()
+
+	def artifact(self) -> bytes:
+		"""The profile as a .tar.gz: profile.json and python.prof."""
+		report = {
+			"jobKey": self.job_key,
+			"seconds": round(self._seconds, 3),
+			**self.meta,
+			"processes": self.processes,
+			"samples": self._sampler.samples,
+			"python": self._python_top(),
+		}
+		with tempfile.NamedTemporaryFile(suffix=".prof") as prof:
+			self._profiler.dump_stats(prof.name)
+			buffer = io.BytesIO()
+			with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+				body = json.dumps(report, indent=1, default=str).encode()
+				info = tarfile.TarInfo("profile.json")
+				info.size = len(body)
+				info.mtime = int(time.time())
+				tar.addfile(info, io.BytesIO(body))
+				tar.add(prof.name, arcname="python.prof")
+		return buffer.getvalue()
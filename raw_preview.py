@@ -0,0 +1,244 @@
+"""
+Embedded JPEG preview extraction for camera RAW files.
+
+CR2, NEF and ARW files are TIFF containers that carry one or more ordinary
+JPEG renditions next to the sensor data. Walking the IFD chain only needs a
+few small reads, so the preview can be located (and copied out) without
+demosaicing or even fetching the whole file.
+"""
+
+import struct
+from dataclasses import dataclass
+from typing import Callable
+
+RAW_EXTENSIONS = {'.raw', '.cr2', '.nef', '.arw'}
+
+# TIFF tags
+_TAG_COMPRESSION = 0x0103
+_TAG_STRIP_OFFSETS = 0x0111
+_TAG_ORIENTATION = 0x0112
+_TAG_STRIP_BYTE_COUNTS = 0x0117
+_TAG_SUB_IFDS = 0x014A
+_TAG_JPEG_OFFSET = 0x0201
+_TAG_JPEG_LENGTH = 0x0202
+_TAG_EXIF_IFD = 0x8769
+
+# Compression values used for JPEG payloads (old-style and new-style)
+_JPEG_COMPRESSION = {6, 7}
+
+# Baseline/extended/progressive huffman SOF markers; SOF3 is the lossless
+# JPEG that CR2/NEF use for the raw sensor data itself and is skipped.
+_DECODABLE_SOF = {0xC0, 0xC1, 0xC2}
+
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 13: 4}
+
+_MAX_IFDS = 32
+_MAX_ENTRIES = 512
+# Values read per tag; only short arrays (offsets, counts, enums) are used, and
+# the count comes from the file, so it must not size a read on its own
+_MAX_VALUES = 256
+_BLOCK_SIZE = 64 * 1024
+
+
+@dataclass
+class RawPreview:
+	offset: int
+	length: int
+	width: int
+	height: int
+	orientation: int = 1
+
+
+###############################################################################
+
+class BlockReader:
+	"""
+	Caches fixed-size blocks from a `read(offset, length)` callable so the many
+	tiny IFD reads turn into a handful of real (possibly ranged S3) reads.
+	"""
+
+	def __init__(self, read: Callable[[int, int], bytes], block_size: int = _BLOCK_SIZE):
+		self._read = read
+		self._block_size = block_size
+		self._blocks: dict[int, bytes] = {}
+
+	def read(self, offset: int, length: int) -> bytes:
+		out = bytearray()
+		while length > 0:
+			index, within = divmod(offset, self._block_size)
+			block = self._blocks.get(index)
+			if block is None:
+				block = self._read(index * self._block_size, self._block_size)
+				self._blocks[index] = block
+			chunk = block[within:within + length]
+			if not chunk:
+				break
+			out += chunk
+			offset += len(chunk)
+			length -= len(chunk)
+		return bytes(out)
+
+###############################################################################
+
+def is_raw_filename(filename: str) -> bool:
+	_, dot, ext = filename.rpartition(".")
+	return bool(dot) and f".{ext.lower()}" in RAW_EXTENSIONS
+
+###############################################################################
+
+def _read_ifd(reader: BlockReader, endian: str, offset: int) -> tuple[dict[int, list[int]], int]:
+	count_raw = reader.read(offset, 2)
+	if len(count_raw) < 2:
+		return {}, 0
+	(count,) = struct.unpack(endian + "H", count_raw)
+	count = min(count, _MAX_ENTRIES)
+	raw = reader.read(offset + 2, count * 12 + 4)
+	if len(raw) < count * 12 + 4:
+		return {}, 0
+
+	tags: dict[int, list[int]] = {}
+	for i in range(count):
+		tag, typ, n, value = struct.unpack(endian + "HHI4s", raw[i * 12:(i + 1) * 12])
+		size = _TYPE_SIZES.get(typ)
+		# Only integer types matter here (offsets, counts, enums)
+		if typ not in (3, 4, 13) or not n:
+			continue
+		n = min(n, _MAX_VALUES)
+		data = value if size * n <= 4 else reader.read(struct.unpack(endian + "I", value)[0], size * n)
+		fmt = "H" if typ == 3 else "I"
+		n = min(n, len(data) // size)
+		tags[tag] = list(struct.unpack(endian + fmt * n, data[:size * n]))
+	(next_offset,) = struct.unpack(endian + "I", raw[count * 12:count * 12 + 4])
+	return tags, next_offset
+
+def _tiff_endian(header: bytes) -> str | None:
+	if header[:4] == b"II*\x00":
+		return "<"
+	if header[:4] == b"MM\x00*":
+		return ">"
+	return None
+
+###############################################################################
+
+def jpeg_dimensions(reader: BlockReader, offset: int, length: int) -> tuple[int, int] | None:
+	"""
+	Walk JPEG markers up to the first SOF and return (width, height) when the
+	stream is a regular lossy JPEG that ordinary decoders accept.
+	"""
+	if reader.read(offset, 2) != b"\xff\xd8":
+		return None
+	pos = offset + 2
+	end = offset + length
+	while pos + 4 <= end:
+		marker = reader.read(pos, 4)
+		if len(marker) < 4 or marker[0] != 0xFF:
+			return None
+		kind = marker[1]
+		if kind == 0xFF:
+			pos += 1
+			continue
+		(seg_len,) = struct.unpack(">H", marker[2:4])
+		if 0xC0 <= kind <= 0xCF and kind not in (0xC4, 0xC8, 0xCC):
+			if kind not in _DECODABLE_SOF:
+				return None
+			sof = reader.read(pos + 5, 4)
+			if len(sof) < 4:
+				return None
+			height, width = struct.unpack(">HH", sof)
+			return width, height
+		if kind == 0xDA:
+			return None
+		pos += 2 + seg_len
+	return None
+
+###############################################################################
+
+def find_preview(read: Callable[[int, int], bytes]) -> RawPreview | None:
+	"""
+	Locate the largest decodable JPEG embedded in a TIFF-based RAW file.
+
+	`read(offset, length)` returns up to `length` bytes at `offset`; it may be
+	backed by a local file or by ranged object reads.
+	"""
+	reader = BlockReader(read)
+	header = reader.read(0, 8)
+	endian = _tiff_endian(header)
+	if endian is None:
+		return None
+
+	(first_ifd,) = struct.unpack(endian + "I", header[4:8])
+	pending = [first_ifd]
+	seen: set[int] = set()
+	candidates: list[tuple[int, int]] = []
+	orientation = 1
+
+	while pending and len(seen) < _MAX_IFDS:
+		ifd_offset = pending.pop(0)
+		if not ifd_offset or ifd_offset in seen:
+			continue
+		seen.add(ifd_offset)
+		tags, next_offset = _read_ifd(reader, endian, ifd_offset)
+		if next_offset:
+			pending.append(next_offset)
+		pending.extend(tags.get(_TAG_SUB_IFDS, []))
+		pending.extend(tags.get(_TAG_EXIF_IFD, []))
+
+		if ifd_offset == first_ifd and tags.get(_TAG_ORIENTATION):
+			orientation = tags[_TAG_ORIENTATION][0]
+		if tags.get(_TAG_JPEG_OFFSET) and tags.get(_TAG_JPEG_LENGTH):
+			candidates.append((tags[_TAG_JPEG_OFFSET][0], tags[_TAG_JPEG_LENGTH][0]))
+		strips = tags.get(_TAG_STRIP_OFFSETS, [])
+		counts = tags.get(_TAG_STRIP_BYTE_COUNTS, [])
+		if tags.get(_TAG_COMPRESSION, [0])[0] in _JPEG_COMPRESSION and len(strips) == 1 and len(counts) == 1:
+			candidates.append((strips[0], counts[0]))
+
+	best = None
+	for offset, length in set(candidates):
+		if not offset or not length:
+			continue
+		dims = jpeg_dimensions(reader, offset, length)
+		if dims is None:
+			continue
+		width, height = dims
+		if best is None or (width * height, length) > (best.width * best.height, best.length):
+			best = RawPreview(offset, length, width, height, orientation)
+	return best
+
+###############################################################################
+
+def file_reader(path: str) -> Callable[[int, int], bytes]:
+	def read(offset: int, length: int) -> bytes:
+		with open(path, "rb") as f:
+			f.seek(offset)
+			return f.read(length)
+	return read
+
+###############################################################################
+
+def jpeg_orientation(read: Callable[[int, int], bytes]) -> int:
+	"""
+	EXIF orientation of a JPEG from its APP1 segment; 1 when there is none.
+	"""
+	reader = BlockReader(read)
+	if reader.read(0, 2) != b"\xff\xd8":
+		return 1
+	pos = 2
+	while True:
+		marker = reader.read(pos, 4)
+		if len(marker) < 4 or marker[0] != 0xFF or marker[1] in (0xDA, 0xD9):
+			return 1
+		if marker[1] == 0xFF:
+			pos += 1
+			continue
+		(seg_len,) = struct.unpack(">H", marker[2:4])
+		if marker[1] == 0xE1 and reader.read(pos + 4, 6) == b"Exif\x00\x00":
+			base = pos + 10
+			exif = BlockReader(lambda offset, length: reader.read(base + offset, length))
+			header = exif.read(0, 8)
+			endian = _tiff_endian(header)
+			if endian is None:
+				return 1
+			tags, _ = _read_ifd(exif, endian, struct.unpack(endian + "I", header[4:8])[0])
+			orientation = tags.get(_TAG_ORIENTATION, [1])[0]
+			return orientation if 1 <= orientation <= 8 else 1
+		pos += 2 + seg_len
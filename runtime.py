@@ -0,0 +1,130 @@
+"""
+Process-wide helpers shared by the app and converter Lambdas.
+
+AWS clients, resources and DynamoDB table handles are created on first use
+and then reused for the life of the container, all with one tuned botocore
+config. boto3 itself is imported lazily too, so requests that never touch
+AWS (the index page) do not pay for it on a cold start.
+
+Cold-start timing: modules report how long their import took through
+`module_loaded`, the first invocation reports how long after the first import
+it started, and client creation is timed as it happens. Each is printed once
+as a `startup` JSON line, e.g.
+
+    {"startup": {"imports": {"status": 0.4, "handler": 6.2}, "firstInvokeMs": 9.8}}
+    {"startup": {"init": "client:s3", "ms": 142.7}}
+"""
+
+import json
+import time
+import threading
+
+# Earliest import start seen; modules that time themselves begin before this one
+_first_import = time.perf_counter()
+
+# Keep-alive connections, a pool large enough for parallel transfers, and
+# adaptive retries that back off when DynamoDB or S3 throttle
+CLIENT_CONFIG = {
+	"max_pool_connections": 32,
+	"tcp_keepalive": True,
+	"connect_timeout": 3,
+	"read_timeout": 60,
+	"retries": {"max_attempts": 5, "mode": "adaptive"},
+}
+
+# Per-service additions. S3 presigned URLs must be SigV4 to sign headers such
+# as Content-Length; SigV2, still the presigning default in us-east-1, signs none
+SERVICE_CONFIG = {"s3": {"signature_version": "s3v4"}}
+
+_lock = threading.RLock()
+_instances: dict[str, object] = {}
+_imports: dict[str, float] = {}
+_reported = False
+
+###############################################################################
+
+def _ms(started: float) -> float:
+	return round((time.perf_counter() - started) * 1000, 1)
+
+
+def _log(payload: dict):
+	print(json.dumps({"startup": payload}))
+
+###############################################################################
+
+def module_loaded(name: str, started: float):
+	"""Record how long importing `name` took (including what it imports)."""
+	global _first_import
+	_imports[name] = _ms(started)
+	_first_import = min(_first_import, started)
+
+
+def report_startup():
+	"""Print the import timings once, on the first invocation of a container."""
+	global _reported
+	if _reported:
+		return
+	_reported = True
+	_log({"imports": _imports, "firstInvokeMs": _ms(_first_import)})
+
+###############################################################################
+
+def _cached(key: str, factory):
+	instance = _instances.get(key)
+	if instance is not None:
+		return instance
+	# boto3 session/client creation is not thread-safe, so build under a lock
+	with _lock:
+		if key not in _instances:
+			started = time.perf_counter()
+			_instances[key] = factory()
+			_log({"init": key, "ms": _ms(started)})
+	return _instances[key]
+
+
+def _boto3():
+	def factory():
+		import boto3
+		return boto3
+	return _cached("import:boto3", factory)
+
+
+def _config():
+	def factory():
+		from botocore.config import Config
+		return Config(**CLIENT_CONFIG)
+	return _cached("config", factory)
+
+
+def client(name: str):
+	def factory():
+		config = _config()
+		if name in SERVICE_CONFIG:
+			from botocore.config import Config
+			config = config.merge(Config(**SERVICE_CONFIG[name]))
+		return _boto3().client(name, config=config)
+	return _cached(f"client:{name}", factory)
+
+
+def resource(name: str):
+	return _cached(f"resource:{name}", lambda: _boto3().resource(name, config=_config()))
+
+
+def table(name: str):
+	return _cached(f"table:{name}", lambda: resource("dynamodb").Table(name))
+
+###############################################################################
+
+class Lazy:
+	"""
+	Module-level stand-in for a client or resource: `s3 = Lazy(client, "s3")`
+	keeps `s3.get_object(...)` call sites unchanged but creates the client on
+	first use instead of at import.
+	"""
+
+	def __init__(self, factory, name: str):
+		self._factory = factory
+		self._name = name
+
+	def __getattr__(self, attr):
+		return getattr(self._factory(self._name), attr)
@@ -2,92 +2,288 @@
 """
 Show usage script for 5MB converter DynamoDB jobs.
 
-Lists all conversion jobs from DynamoDB, newest first.
+Queries the `by-day` index (UTC day + updated_at) for jobs updated in a time
+window, so only that window is read, never the whole table. Items are
+processed as the pages arrive and only the numbers needed for the summary are
+kept. Prints aggregates: jobs per hour, success rate, p50/p95/p99 conversion
+time, bytes in vs out and encode passes per media type.
+
+With --rollups it reads the converter's hourly rollup items instead, which
+also cover periods whose job records have already expired; percentiles then
+come from the histogram buckets and are upper bounds. Rollups are fetched by
+key, one per hour, media type and outcome (9 per hour), with BatchGetItem
+100 keys at a time: about 3 calls per day of window, ~800 for a year.
 Requires boto3 and AWS credentials configured.
 
-Usage: python3 show_usage.py
+Usage: python3 show_usage.py [--hours 24 | --since 2025-09-01 [--until 2025-09-07]] [--list | --rollups]
 """
 
 import os
+import math
+import time
+import argparse
 import boto3
-from datetime import datetime
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
 
 
 TABLE_NAME = "fivemb-website-dev-uploads-status"
 
+# status reads DYNAMO_TABLE at import; this script finds the table itself
+os.environ.setdefault("DYNAMO_TABLE", TABLE_NAME)
+# Index name and rollup key/attribute layout come from the module that writes them
+import status  # noqa: E402
+
 
 ###############################################################################
 
-def main():
-    dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
-    
+def _find_table(dynamodb_client):
     # List all tables to find the correct one
-    dynamodb_client = boto3.client("dynamodb", region_name="us-east-1")
     tables = dynamodb_client.list_tables()
     print(f"Available DynamoDB tables: {tables['TableNames']}")
-    
-    # Check if our table exists or find a similar one
-    target_table = None
     for table_name in tables['TableNames']:
         if 'uploads-status' in table_name:
-            target_table = table_name
-            break
-    
+            return table_name
+    print(f"No table containing 'uploads-status' found.")
+    print(f"This likely means the serverless stack hasn't been deployed yet.")
+    print(f"Available tables: {tables['TableNames']}")
+    print(f"\nTo deploy the stack, run: serverless deploy")
+    print(f"Once deployed, the table name should be: {TABLE_NAME}")
+    return None
+
+
+def _parse_time(value):
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+###############################################################################
+
+def query_window(table, start, end):
+    """Yield job items updated in [start, end), one UTC day partition at a time, newest first."""
+    day = end.date()
+    while day >= start.date():
+        kwargs = {
+            "IndexName": status.DAY_INDEX,
+            "KeyConditionExpression": "#day = :day AND updated_at BETWEEN :start AND :end",
+            "ExpressionAttributeNames": {"#day": "day"},
+            "ExpressionAttributeValues": {
+                ":day": day.isoformat(),
+                ":start": int(start.timestamp()),
+                ":end": int(end.timestamp()) - 1,
+            },
+            "ScanIndexForward": False,
+        }
+        while True:
+            response = table.query(**kwargs)
+            yield from response["Items"]
+            if "LastEvaluatedKey" not in response:
+                break
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        day -= timedelta(days=1)
+
+
+def read_rollups(dynamodb, table_name, start, end):
+    """Yield the rollup items of every hour overlapping [start, end)."""
+    hour = start.replace(minute=0, second=0, microsecond=0)
+    keys = []
+    while hour < end:
+        bucket = status.hour_bucket(int(hour.timestamp()))
+        keys += [status.rollup_key(bucket, media, outcome) for media in status.ROLLUP_MEDIA for outcome in status.ROLLUP_OUTCOMES]
+        hour += timedelta(hours=1)
+    limit = status.BATCH_GET_LIMIT
+    for i in range(0, len(keys), limit):
+        pending = {table_name: {"Keys": [{"upload_key": key} for key in keys[i:i + limit]]}}
+        for attempt in range(8):
+            response = dynamodb.batch_get_item(RequestItems=pending)
+            yield from response["Responses"].get(table_name, [])
+            pending = response.get("UnprocessedKeys") or {}
+            if not pending:
+                break
+            time.sleep(0.05 * 2 ** attempt)
+
+
+def histogram_percentile(counts, pct):
+    # Upper bound of the bucket holding the pct-th job
+    total = sum(counts)
+    if not total:
+        return None
+    rank = max(1, math.ceil(total * pct / 100))
+    seen = 0
+    for bound, count in zip([*status.ROLLUP_BUCKETS_MS, None], counts):
+        seen += count
+        if seen >= rank:
+            return f"<={bound}" if bound else f">{status.ROLLUP_BUCKETS_MS[-1]}"
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(len(sorted_values) * pct / 100))
+    return sorted_values[rank - 1]
+
+
+###############################################################################
+
+class Summary:
+    def __init__(self):
+        self.states = Counter()
+        self.per_hour = Counter()
+        self.bytes_in = Counter()
+        self.bytes_out = Counter()
+        self.durations = defaultdict(list)
+        self.passes = defaultdict(Counter)
+
+    def add(self, item):
+        state = item.get("state", "unknown")
+        self.states[state] += 1
+        updated_at = int(item.get("updated_at", 0))
+        self.per_hour[datetime.fromtimestamp(updated_at, timezone.utc).strftime("%Y-%m-%d %H:00")] += 1
+        metrics = item.get("metrics") or {}
+        if not metrics:
+            return
+        media = metrics.get("media") or _media_of(item)
+        if state == "completed":
+            self.durations[media].append(int(metrics.get("totalMs", 0)))
+        self.bytes_in[media] += int(metrics.get("bytesIn", 0))
+        self.bytes_out[media] += int(metrics.get("bytesOut", 0))
+        self.passes[media][int(metrics.get("passes", 0))] += 1
+
+    def print(self, hours):
+        total = sum(self.states.values())
+        finished = self.states["completed"] + self.states["failure"]
+        print("=" * 80)
+        print(f"Jobs: {total} ({total / max(hours, 1):.1f}/hour)   " + "   ".join(f"{k}: {v}" for k, v in sorted(self.states.items())))
+        if finished:
+            print(f"Success rate: {100 * self.states['completed'] / finished:.1f}% of {finished} finished")
+
+        print("\nJobs per hour (UTC):")
+        for hour, count in sorted(self.per_hour.items()):
+            print(f"  {hour}  {count:>5}  {'#' * min(count, 60)}")
+
+        for media in sorted(self.bytes_in):
+            print(f"\n[{media}]")
+            self.print_media(media)
+
+    def print_media(self, media):
+        durations = sorted(self.durations[media])
+        if durations:
+            p50, p95, p99 = (percentile(durations, p) for p in (50, 95, 99))
+            print(f"  conversion time (ms): p50 {p50}  p95 {p95}  p99 {p99}  over {len(durations)} completed")
+        self.print_bytes(media)
+        print("  encode passes: " + ", ".join(f"{n}: {c}" for n, c in sorted(self.passes[media].items())))
+
+    def print_bytes(self, media):
+        bytes_in, bytes_out = self.bytes_in[media], self.bytes_out[media]
+        ratio = f"  ({100 * bytes_out / bytes_in:.1f}% of input)" if bytes_in else ""
+        print(f"  bytes in: {bytes_in / 1e6:.1f} MB   bytes out: {bytes_out / 1e6:.1f} MB{ratio}")
+
+
+class RollupSummary(Summary):
+    """Same report from hourly rollup items; rollups keep sums and a histogram, not single jobs."""
+
+    def __init__(self):
+        super().__init__()
+        self.jobs = Counter()
+        self.completed = Counter()
+        self.total_ms = Counter()
+        self.pass_total = Counter()
+        self.histograms = defaultdict(lambda: [0] * len(status.ROLLUP_HISTOGRAM))
+
+    def add(self, item):
+        jobs = int(item.get("jobs", 0))
+        media, outcome = item.get("media", "unknown"), item.get("outcome", "unknown")
+        self.states[outcome] += jobs
+        self.per_hour[item.get("hour", "").replace("T", " ") + ":00"] += jobs
+        self.jobs[media] += jobs
+        self.bytes_in[media] += int(item.get("bytesIn", 0))
+        self.bytes_out[media] += int(item.get("bytesOut", 0))
+        self.pass_total[media] += int(item.get("passes", 0))
+        if outcome == "completed":
+            self.completed[media] += jobs
+            self.total_ms[media] += int(item.get("totalMs", 0))
+            histogram = self.histograms[media]
+            for i, name in enumerate(status.ROLLUP_HISTOGRAM):
+                histogram[i] += int(item.get(name, 0))
+
+    def print_media(self, media):
+        completed = self.completed[media]
+        if completed:
+            p50, p95, p99 = (histogram_percentile(self.histograms[media], p) for p in (50, 95, 99))
+            print(f"  conversion time (ms): mean {self.total_ms[media] // completed}  p50 {p50}  p95 {p95}  p99 {p99}  over {completed} completed")
+        self.print_bytes(media)
+        print(f"  encode passes: {self.pass_total[media] / max(self.jobs[media], 1):.2f} per job")
+
+
+def _media_of(item):
+    # Older records carry no media in their metrics; guess from the output
+    output = item.get("output", "")
+    if output.endswith(".jpg"):
+        return "image"
+    return "video" if output else "unknown"
+
+
+###############################################################################
+
+def print_job(item):
+    upload_key = item.get("upload_key", "")
+    state = item.get("state", "unknown")
+    updated_at = int(item.get("updated_at", 0))
+    output = item.get("output", "")
+    error = item.get("error", "")
+
+    timestamp = datetime.fromtimestamp(updated_at).strftime("%Y-%m-%d %H:%M:%S") if updated_at else "unknown"
+    filename = upload_key.split("/")[-1] if upload_key.count("/") >= 2 else ""
+
+    print(f"{timestamp:<20} {state:<12} {filename:<50} {upload_key}")
+    if output:
+        print(f"{'':20} {'':12} Output: {output}")
+    if error:
+        print(f"{'':20} {'':12} Error: {error}")
+    print()
+
+
+###############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Usage and performance report for the converter")
+    parser.add_argument("--hours", type=int, default=24, help="window ending now (default 24)")
+    parser.add_argument("--since", help="window start, ISO date or time (UTC)")
+    parser.add_argument("--until", help="window end, ISO date or time (UTC; default now)")
+    parser.add_argument("--list", action="store_true", help="also list each job, newest first")
+    parser.add_argument("--rollups", action="store_true", help="read the hourly rollups instead of job records")
+    args = parser.parse_args()
+
+    end = _parse_time(args.until) if args.until else datetime.now(timezone.utc)
+    start = _parse_time(args.since) if args.since else end - timedelta(hours=args.hours)
+    hours = (end - start).total_seconds() / 3600
+
+    dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+    target_table = _find_table(boto3.client("dynamodb", region_name="us-east-1"))
     if not target_table:
-        print(f"No table containing 'uploads-status' found.")
-        print(f"This likely means the serverless stack hasn't been deployed yet.")
-        print(f"Available tables: {tables['TableNames']}")
-        print(f"\nTo deploy the stack, run: serverless deploy")
-        print(f"Once deployed, the table name should be: {TABLE_NAME}")
         return 0
-    
-    print(f"Using table: {target_table}")
+
+    print(f"Using table: {target_table}, window {start:%Y-%m-%d %H:%M} .. {end:%Y-%m-%d %H:%M} UTC")
     table = dynamodb.Table(target_table)
-    
+
+    summary = RollupSummary() if args.rollups else Summary()
     try:
-        response = table.scan()
-        items = response["Items"]
-        
-        while "LastEvaluatedKey" in response:
-            response = table.scan(ExclusiveStartKey=response["LastEvaluatedKey"])
-            items.extend(response["Items"])
-        
-        items.sort(key=lambda x: int(x.get("updated_at", 0)), reverse=True)
-        
-        print(f"Found {len(items)} jobs in DynamoDB:")
-        print("-" * 120)
-        
+        if args.rollups:
+            items = read_rollups(dynamodb, target_table, start, end)
+        else:
+            items = query_window(table, start, end)
+            if args.list:
+                print("-" * 120)
         for item in items:
-            upload_key = item.get("upload_key", "")
-            state = item.get("state", "unknown")
-            updated_at = int(item.get("updated_at", 0))
-            source = item.get("source", "")
-            output = item.get("output", "")
-            error = item.get("error", "")
-            
-            timestamp = datetime.fromtimestamp(updated_at).strftime("%Y-%m-%d %H:%M:%S") if updated_at else "unknown"
-            
-            filename = ""
-            if upload_key:
-                parts = upload_key.split("/")
-                if len(parts) >= 3:
-                    filename = parts[-1]
-            
-            status_display = state
-            if error:
-                status_display += f" ({error})"
-            
-            print(f"{timestamp:<20} {state:<12} {filename:<50} {upload_key}")
-            if output:
-                print(f"{'':20} {'':12} Output: {output}")
-            if error:
-                print(f"{'':20} {'':12} Error: {error}")
-            print()
-            
+            summary.add(item)
+            if args.list and not args.rollups:
+                print_job(item)
     except Exception as e:
-        print(f"Error scanning DynamoDB table: {e}")
+        print(f"Error querying DynamoDB table: {e}")
         return 1
-    
+
+    summary.print(hours)
     return 0
 
 
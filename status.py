@@ -0,0 +1,231 @@
+"""
+Job status records shared by the web handler and the converter.
+
+Both sides only ever patch the attributes they own with update_item, so a
+write from one never drops fields written by the other. State moves forward
+only (queued -> processing -> completed/failure/cancelled); the rank of the
+current state is stored next to it and every transition is conditioned on
+it, so a late "queued" from the upload API cannot overwrite a job the
+converter already picked up, and nothing reopens a finished job. The one
+exception is failure -> processing: a failed run frees its conversion lease
+so Lambda's retry of the same event can convert again.
+
+Every transition also stamps `day` (UTC, YYYY-MM-DD); with `updated_at` it
+keys the `by-day` index that usage reports query by time window. Lease items
+never get it, so the index only holds jobs.
+
+Finished jobs are also added to per-hour rollup items
+(`rollup#<hour>#<media>#<outcome>`) with atomic ADDs: counts, byte and time
+totals and a histogram of total conversion time. They carry no ttl, so they
+outlive the job records, and no `day`, so they stay out of the index.
+
+Progress updates use a separate, deliberately small attribute set (`ph`,
+`pc`, `pt`) and are throttled per job, so frequent updates cost one small
+write each.
+"""
+
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+import os
+
+import runtime
+
+DYNAMO_TABLE = os.environ["DYNAMO_TABLE"]
+dynamodb = runtime.Lazy(runtime.resource, "dynamodb")
+
+TTL_SECONDS = 7 * 24 * 60 * 60
+
+# Sparse GSI: day (S) + updated_at (N)
+DAY_INDEX = "by-day"
+
+STATE_RANK = {
+	"queued": 1,
+	"processing": 2,
+	"completed": 3,
+	"failure": 3,
+	"cancelled": 3,
+}
+TERMINAL_RANK = 3
+
+# Minimum seconds between progress writes for one job (phase changes always go)
+PROGRESS_INTERVAL = 2.0
+
+# BatchGetItem takes at most 100 keys; throttled leftovers are retried with backoff
+BATCH_GET_LIMIT = 100
+BATCH_GET_RETRIES = 5
+
+# Upper bounds (ms) of the rollup histogram of total conversion time; the last bucket is open
+ROLLUP_BUCKETS_MS = [1000, 2000, 5000, 10000, 30000, 60000, 120000, 300000, 600000]
+# Histogram attribute names, one per bucket
+ROLLUP_HISTOGRAM = [f"le{bound}" for bound in ROLLUP_BUCKETS_MS] + ["inf"]
+# Every media and outcome part of a rollup key, so readers can list an hour's keys
+ROLLUP_MEDIA = ["image", "video", "unknown"]
+ROLLUP_OUTCOMES = ["completed", "failure", "cancelled"]
+# Summed per rollup next to the job count
+ROLLUP_SUMS = ["totalMs", "queueDelayMs", "downloadMs", "probeMs", "decodeMs", "encodeMs", "uploadMs", "passes", "bytesIn", "bytesOut"]
+
+_last_progress: dict[str, tuple[float, str]] = {}
+
+###############################################################################
+
+def _table():
+	return runtime.table(DYNAMO_TABLE)
+
+
+def day_bucket(epoch_seconds: int) -> str:
+	return time.strftime("%Y-%m-%d", time.gmtime(epoch_seconds))
+
+
+def hour_bucket(epoch_seconds: int) -> str:
+	return time.strftime("%Y-%m-%dT%H", time.gmtime(epoch_seconds))
+
+
+def rollup_key(hour: str, media: str, outcome: str) -> str:
+	return f"rollup#{hour}#{media}#{outcome}"
+
+
+def histogram_bucket(total_ms: int) -> str:
+	for bound, name in zip(ROLLUP_BUCKETS_MS, ROLLUP_HISTOGRAM):
+		if total_ms <= bound:
+			return name
+	return ROLLUP_HISTOGRAM[-1]
+
+###############################################################################
+
+def transition(upload_key: str, state: str, extra: dict | None = None) -> bool:
+	"""
+	Move a job to `state`, setting the attributes in `extra` alongside it.
+	Returns False (and writes nothing) when the job is already at or past
+	that state; repeated non-terminal writes are allowed so messages can change.
+	"""
+	rank = STATE_RANK[state]
+	now = int(time.time())
+	names = {"#state": "state", "#rank": "rank", "#ttl": "ttl", "#source": "source", "#day": "day"}
+	values = {":state": state, ":rank": rank, ":now": now, ":ttl": now + TTL_SECONDS, ":source": upload_key, ":day": day_bucket(now)}
+	sets = ["#state = :state", "#rank = :rank", "updated_at = :now", "#day = :day", "#ttl = if_not_exists(#ttl, :ttl)"]
+	extra = dict(extra or {})
+	if "source" in extra:
+		values[":source"] = extra.pop("source")
+		sets.append("#source = :source")
+	else:
+		sets.append("#source = if_not_exists(#source, :source)")
+	for i, (name, value) in enumerate(extra.items()):
+		names[f"#x{i}"] = name
+		values[f":x{i}"] = value
+		sets.append(f"#x{i} = :x{i}")
+
+	op = "<" if rank == TERMINAL_RANK else "<="
+	condition = f"attribute_not_exists(#rank) OR #rank {op} :rank"
+	if state == "processing":
+		# Retries of a failed conversion (the converter holds a fresh lease)
+		condition += " OR #state = :failure"
+		values[":failure"] = "failure"
+	try:
+		_table().update_item(
+			Key={"upload_key": upload_key},
+			UpdateExpression="SET " + ", ".join(sets),
+			ConditionExpression=condition,
+			ExpressionAttributeNames=names,
+			ExpressionAttributeValues=values,
+		)
+	except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+		return False
+	finally:
+		_last_progress.pop(upload_key, None)
+	return True
+
+###############################################################################
+
+def progress(upload_key: str, phase: str, percent: int | None = None):
+	"""
+	Record what a running job is doing. Only lands while the job is still
+	processing, and is skipped when the same phase was written moments ago.
+	"""
+	now = time.monotonic()
+	last = _last_progress.get(upload_key)
+	if last and last[1] == phase and now - last[0] < PROGRESS_INTERVAL:
+		return
+	_last_progress[upload_key] = (now, phase)
+
+	values = {":ph": phase, ":pt": int(time.time()), ":processing": "processing"}
+	sets = ["ph = :ph", "pt = :pt"]
+	if percent is not None:
+		values[":pc"] = int(percent)
+		sets.append("pc = :pc")
+	try:
+		_table().update_item(
+			Key={"upload_key": upload_key},
+			UpdateExpression="SET " + ", ".join(sets),
+			ConditionExpression="#state = :processing",
+			ExpressionAttributeNames={"#state": "state"},
+			ExpressionAttributeValues=values,
+		)
+	except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+		pass
+
+###############################################################################
+
+def add_to_rollup(summary: dict, outcome: str):
+	"""
+	Count one finished job (a metrics summary) into its hour's rollup. A
+	single ADD-only update, so concurrent converters never lose increments.
+	"""
+	now = int(time.time())
+	hour = hour_bucket(now)
+	media = summary.get("media") or "unknown"
+	names = {"#jobs": "jobs", "#hist": histogram_bucket(int(summary.get("totalMs", 0)))}
+	values = {":one": 1, ":hour": hour, ":media": media, ":outcome": outcome, ":now": now}
+	adds = ["#jobs :one", "#hist :one"]
+	for i, name in enumerate(ROLLUP_SUMS):
+		if name in summary:
+			names[f"#s{i}"] = name
+			values[f":s{i}"] = int(summary[name])
+			adds.append(f"#s{i} :s{i}")
+	_table().update_item(
+		Key={"upload_key": rollup_key(hour, media, outcome)},
+		UpdateExpression="SET #hour = :hour, #media = :media, #outcome = :outcome, updated_at = :now ADD " + ", ".join(adds),
+		ExpressionAttributeNames={**names, "#hour": "hour", "#media": "media", "#outcome": "outcome"},
+		ExpressionAttributeValues=values,
+	)
+
+###############################################################################
+
+def get(upload_key: str, attributes: list[str] | None = None) -> dict | None:
+	kwargs = {}
+	if attributes:
+		names = {f"#a{i}": name for i, name in enumerate(attributes)}
+		kwargs["ProjectionExpression"] = ", ".join(names)
+		kwargs["ExpressionAttributeNames"] = names
+	response = _table().get_item(Key={"upload_key": upload_key}, **kwargs)
+	return response.get("Item")
+
+###############################################################################
+
+def get_many(upload_keys: list[str], attributes: list[str] | None = None) -> dict[str, dict]:
+	"""
+	Fetch many records with BatchGetItem, 100 keys per call, retrying any
+	keys DynamoDB hands back unprocessed. Missing keys are simply absent.
+	"""
+	request: dict = {}
+	if attributes:
+		names = {f"#a{i}": name for i, name in enumerate(["upload_key", *attributes])}
+		request["ProjectionExpression"] = ", ".join(names)
+		request["ExpressionAttributeNames"] = names
+	keys = list(dict.fromkeys(upload_keys))
+	found: dict[str, dict] = {}
+	for start in range(0, len(keys), BATCH_GET_LIMIT):
+		pending = {DYNAMO_TABLE: {**request, "Keys": [{"upload_key": key} for key in keys[start:start + BATCH_GET_LIMIT]]}}
+		for attempt in range(BATCH_GET_RETRIES):
+			response = dynamodb.batch_get_item(RequestItems=pending)
+			for item in response.get("Responses", {}).get(DYNAMO_TABLE, []):
+				found[item["upload_key"]] = item
+			pending = response.get("UnprocessedKeys") or {}
+			if not pending:
+				break
+			time.sleep(0.05 * 2 ** attempt)
+	return found
+
+###############################################################################
+
+runtime.module_loaded(__name__, _IMPORT_STARTED)
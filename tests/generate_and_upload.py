@@ -10,7 +10,11 @@ from dataclasses import dataclass
 
 
 API_BASE = os.environ.get("API_BASE", "https://7hme1ull8j.execute-api.us-east-1.amazonaws.com")
-CHUNK_SIZE = 10 * 1024 * 1024
+CHUNK_SIZE = 10 * 1024 * 1024  # starting part size
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 minimum for every part but the last
+MAX_PART_SIZE = 64 * 1024 * 1024
+MAX_PARTS = 10000
+TARGET_PART_SECONDS = 5
 MAX_SIZE_BYTES = 200 * 1024 * 1024
 
 
@@ -67,9 +71,10 @@ def _http_get(url: str) -> bytes:
     return res.stdout
 
 
-def _http_put(url: str, data_path: pathlib.Path) -> dict:
+def _http_put(url: str, data_path: pathlib.Path, content_type: str | None = None) -> dict:
     # Capture response headers to extract ETag
-    res = _run(["curl", "-sS", "-D", "-", "-o", "/dev/null", "-X", "PUT", url, "--upload-file", str(data_path)])
+    headers = ["-H", f"Content-Type: {content_type}"] if content_type else []
+    res = _run(["curl", "-sS", "-D", "-", "-o", "/dev/null", "-X", "PUT", url, *headers, "--upload-file", str(data_path)])
     headers = res.stdout.decode("utf-8").splitlines()
     etag = None
     for line in headers:
@@ -81,27 +86,55 @@ def _http_put(url: str, data_path: pathlib.Path) -> dict:
     return {"ok": True, "etag": etag}
 
 
+def _next_part_size(part_size: int, part_bytes: int, seconds: float, file_size: int) -> int:
+    # Aim for parts that take TARGET_PART_SECONDS at the measured speed, smoothed
+    ideal = part_bytes / max(seconds, 0.001) * TARGET_PART_SECONDS
+    size = min(MAX_PART_SIZE, max(MIN_PART_SIZE, (part_size + ideal) / 2))
+    return max(int(size) // (1024 * 1024) * (1024 * 1024), -(-file_size // MAX_PARTS))
+
+
+def single_upload(file_path: pathlib.Path) -> dict:
+    # Small files: one presigned PUT, the converter fires on ObjectCreated:Put
+    mime = mimetypes.guess_type(file_path.name)[0] or "application/octet-stream"
+    up = _http_json("POST", f"{API_BASE}/api/upload", {"filename": file_path.name, "contentType": mime, "size": file_path.stat().st_size})
+    put_res = _http_put(up["url"], file_path, up["contentType"])
+    return {"key": up["key"], "result": put_res}
+
+
 def multipart_upload(file_path: pathlib.Path) -> dict:
     mime = mimetypes.guess_type(file_path.name)[0] or "application/octet-stream"
-    init = _http_json("POST", f"{API_BASE}/api/multipart/initiate", {"filename": file_path.name, "contentType": mime})
+    size = file_path.stat().st_size
+    part_size = max(CHUNK_SIZE, -(-size // MAX_PARTS))
+    # Initiate returns presigned URLs for the first batch of parts
+    init = _http_json("POST", f"{API_BASE}/api/multipart/initiate", {"filename": file_path.name, "contentType": mime, "parts": -(-size // part_size)})
     upload_id = init["uploadId"]
     key = init["key"]
+    urls = init.get("urls", {})
 
-    size = file_path.stat().st_size
-    num_parts = (size + CHUNK_SIZE - 1) // CHUNK_SIZE
     parts: list[dict] = []
+    offset = 0
+    part_number = 0
     with open(file_path, "rb") as f:
-        for part_number in range(1, num_parts + 1):
-            start = (part_number - 1) * CHUNK_SIZE
-            end = min(start + CHUNK_SIZE, size)
-            f.seek(start)
+        while offset < size:
+            part_number += 1
+            # Never leave more bytes than the remaining part numbers can carry
+            end = min(offset + max(part_size, -(-(size - offset) // (MAX_PARTS - part_number + 1))), size)
+            if size - end < MIN_PART_SIZE:
+                end = size
+            f.seek(offset)
             chunk_path = file_path.parent / f".{file_path.name}.part{part_number}"
             with open(chunk_path, "wb") as cp:
-                cp.write(f.read(end - start))
-            presigned = _http_json("GET", f"{API_BASE}/api/multipart/url?key={key}&uploadId={upload_id}&partNumber={part_number}")
-            put_res = _http_put(presigned["url"], chunk_path)
+                cp.write(f.read(end - offset))
+            if str(part_number) not in urls:
+                remaining = -(-(size - offset) // part_size)
+                more = _http_json("GET", f"{API_BASE}/api/multipart/urls?key={key}&uploadId={upload_id}&start={part_number}&count={remaining}")
+                urls.update(more["urls"])
+            t0 = time.time()
+            put_res = _http_put(urls[str(part_number)], chunk_path)
+            part_size = _next_part_size(part_size, end - offset, time.time() - t0, size)
             parts.append({"ETag": put_res["etag"], "PartNumber": part_number})
             chunk_path.unlink(missing_ok=True)
+            offset = end
 
     complete = _http_json("POST", f"{API_BASE}/api/multipart/complete", {
         "key": key,
@@ -111,15 +144,16 @@ def multipart_upload(file_path: pathlib.Path) -> dict:
     return {"key": key, "result": complete}
 
 
-def poll_status(key: str, timeout_s: int = 900, interval_s: int = 3) -> dict:
+def poll_status(key: str, timeout_s: int = 900, wait_s: int = 20) -> dict:
     start = time.time()
     while time.time() - start < timeout_s:
-        s = _http_json("GET", f"{API_BASE}/api/status?key={key}")
+        # Long-poll: the server holds the request until the job changes
+        s = _http_json("GET", f"{API_BASE}/api/status?key={key}&wait={wait_s}")
         if s.get("failed"):
             return {"state": "failure", "detail": s}
         if s.get("ready"):
             return {"state": "completed", "detail": s}
-        time.sleep(interval_s)
+        time.sleep(s.get("retryAfter", 3))
     return {"state": "timeout", "detail": {}}
 
 
@@ -155,7 +189,7 @@ def main():
             gen_ms = int((time.time() - t0) * 1000)
 
             up0 = time.time()
-            up = multipart_upload(fpath)
+            up = single_upload(fpath) if 0 < fpath.stat().st_size <= CHUNK_SIZE else multipart_upload(fpath)
             upload_ms = int((time.time() - up0) * 1000)
 
             ps0 = time.time()
@@ -0,0 +1,95 @@
+"""
+Long-poll check for POST /api/status against moto's in-process DynamoDB and S3.
+
+Covers the three ways a held request ends: at once when a job has already
+finished, early when a job finishes during the hold, and at the deadline when
+nothing changes. Needs the packages in tests/requirements.txt; no AWS account.
+
+Usage: python tests/long_poll_check.py
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+
+os.environ.update({
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "BUCKET_NAME": "long-poll-check",
+    "DYNAMO_TABLE": "long-poll-check-status",
+})
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import boto3
+from moto import mock_aws
+
+
+class _Context:
+    # Plenty of Lambda time left, so `wait` is not cut short
+    def get_remaining_time_in_millis(self):
+        return 60_000
+
+
+def _poll(handler, keys, wait):
+    event = {
+        "rawPath": "/api/status",
+        "requestContext": {"http": {"method": "POST"}},
+        "body": json.dumps({"keys": keys, "wait": wait}),
+    }
+    started = time.monotonic()
+    response = handler._handle_status_batch(event, _Context())
+    assert response["statusCode"] == 200, response
+    return json.loads(response["body"]), time.monotonic() - started
+
+
+def main():
+    with mock_aws():
+        boto3.client("s3").create_bucket(Bucket=os.environ["BUCKET_NAME"])
+        boto3.client("dynamodb").create_table(
+            TableName=os.environ["DYNAMO_TABLE"],
+            KeySchema=[{"AttributeName": "upload_key", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "upload_key", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+
+        import status
+        import handler
+
+        running, finishing, failed = "uploads/a/run.jpg", "uploads/b/finish.jpg", "uploads/c/fail.jpg"
+        for key in (running, finishing, failed):
+            status.transition(key, "processing")
+        status.transition(failed, "failure", {"error": "boom"})
+
+        # Already finished: answered without holding
+        body, seconds = _poll(handler, [running, failed], wait=10)
+        assert body["statuses"][failed]["failed"] and seconds < 1, (body, seconds)
+        print(f"finished job returns at once: {seconds:.2f}s")
+
+        # Nothing changes: held until the deadline, then the client may ask again
+        body, seconds = _poll(handler, [running], wait=3)
+        assert body["statuses"][running]["state"] == "processing", body
+        assert 2 <= seconds <= 4 and body["retryAfter"] == 0, (body, seconds)
+        print(f"unchanged jobs held to the deadline: {seconds:.2f}s")
+
+        # A job finishes during the hold: the request returns early
+        def finish():
+            time.sleep(1.5)
+            status.transition(finishing, "completed", {"output": "processed/finish.jpg", "outputSize": 1234, "outputType": "image/jpeg"})
+
+        writer = threading.Thread(target=finish)
+        writer.start()
+        body, seconds = _poll(handler, [running, finishing], wait=20)
+        writer.join()
+        assert body["statuses"][finishing]["ready"] and body["statuses"][finishing]["url"], body
+        assert seconds < 6, seconds
+        print(f"job finishing mid-hold returns early: {seconds:.2f}s")
+
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""
+S3 transfers for the converter, sized to the host.
+
+Downloads split the object into ranges fetched by a pool of streams and
+written in place with pwrite. The first ranged GET also reports the object
+size (Content-Range), so no HeadObject is needed, which the bucket policy may
+forbid. Uploads above one part go up as a multipart upload with concurrent
+parts. The fallback download streams the body in chunks instead of reading
+it into memory. Every transfer logs one `transfer` JSON line with its
+throughput.
+
+Benchmark against any S3-compatible endpoint (MinIO, moto_server, LocalStack)
+or a real bucket, comparing these paths with boto3's default transfers:
+
+    python transfer.py benchmark --endpoint-url http://localhost:9000 --bucket bench [--size-mb 256] [--streams 1,4,16]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from dataclasses import dataclass, asdict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Lambda's network share grows with memory, as does its vCPU count, so the
+# number of streams follows the CPUs; the client pool (runtime.py) allows 32
+STREAMS = int(os.environ.get("TRANSFER_STREAMS") or min(32, max(4, (os.cpu_count() or 1) * 4)))
+PART_SIZE = int(os.environ.get("TRANSFER_PART_MB") or 16) * MB
+# Upload parts are held in memory while in flight; cap the total
+MAX_UPLOAD_BUFFER = 256 * MB
+_CHUNK = 1 * MB
+
+
+@dataclass
+class TransferStats:
+	direction: str
+	key: str
+	bytes: int
+	seconds: float
+	streams: int
+	parts: int
+
+	@property
+	def mb_per_second(self) -> float:
+		return round(self.bytes / MB / max(self.seconds, 1e-6), 1)
+
+	def log(self):
+		logger.info(json.dumps({"transfer": {**asdict(self), "seconds": round(self.seconds, 3), "MBps": self.mb_per_second}}))
+
+###############################################################################
+
+def _total_size(response: dict) -> int:
+	# "bytes 0-16777215/734003200"
+	content_range = response.get("ContentRange") or ""
+	_, _, total = content_range.rpartition("/")
+	if total.isdigit():
+		return int(total)
+	return int(response.get("ContentLength") or 0)
+
+
+def _write_at(fd: int, body, offset: int) -> int:
+	written = 0
+	for chunk in iter(lambda: body.read(_CHUNK), b""):
+		os.pwrite(fd, chunk, offset + written)
+		written += len(chunk)
+	return written
+
+###############################################################################
+
+def download(client, bucket: str, key: str, path: str, streams: int = STREAMS, part_size: int = PART_SIZE) -> TransferStats:
+	"""Fetch `key` into `path` with up to `streams` concurrent ranged GETs."""
+	started = time.perf_counter()
+	first = client.get_object(Bucket=bucket, Key=key, Range=f"bytes=0-{part_size - 1}")
+	total = _total_size(first)
+	ranges = [(offset, min(offset + part_size, total) - 1) for offset in range(part_size, total, part_size)]
+
+	def fetch(byte_range: tuple[int, int]):
+		start, end = byte_range
+		obj = client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")
+		if _write_at(fd, obj["Body"], start) != end - start + 1:
+			raise IOError(f"Short read for {key} bytes {start}-{end}")
+
+	workers = max(1, min(streams, len(ranges)))
+	with open(path, "wb") as f:
+		f.truncate(total)
+		fd = f.fileno()
+		_write_at(fd, first["Body"], 0)
+		if ranges:
+			with ThreadPoolExecutor(workers) as pool:
+				list(pool.map(fetch, ranges))
+	stats = TransferStats("download", key, total, time.perf_counter() - started, workers, len(ranges) + 1)
+	stats.log()
+	return stats
+
+
+def stream_download(client, bucket: str, key: str, path: str) -> TransferStats:
+	"""Single-stream fallback: one GET, copied to disk in chunks."""
+	started = time.perf_counter()
+	obj = client.get_object(Bucket=bucket, Key=key)
+	with open(path, "wb") as f:
+		shutil.copyfileobj(obj["Body"], f, _CHUNK)
+		size = f.tell()
+	stats = TransferStats("download", key, size, time.perf_counter() - started, 1, 1)
+	stats.log()
+	return stats
+
+###############################################################################
+
+def upload(client, bucket: str, key: str, path: str, content_type: str | None = None, streams: int = STREAMS, part_size: int = PART_SIZE) -> TransferStats:
+	"""Put `path` at `key`; multipart with concurrent parts above one part size."""
+	started = time.perf_counter()
+	size = os.path.getsize(path)
+	extra = {"ContentType": content_type} if content_type else {}
+	if size <= part_size:
+		with open(path, "rb") as f:
+			client.put_object(Bucket=bucket, Key=key, Body=f, **extra)
+		stats = TransferStats("upload", key, size, time.perf_counter() - started, 1, 1)
+		stats.log()
+		return stats
+
+	upload_id = client.create_multipart_upload(Bucket=bucket, Key=key, **extra)["UploadId"]
+	offsets = list(range(0, size, part_size))
+
+	def send(index: int) -> dict:
+		with open(path, "rb") as f:
+			data = os.pread(f.fileno(), part_size, offsets[index])
+		response = client.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=index + 1, Body=data)
+		return {"ETag": response["ETag"], "PartNumber": index + 1}
+
+	workers = max(1, min(streams, len(offsets), MAX_UPLOAD_BUFFER // part_size))
+	try:
+		with ThreadPoolExecutor(workers) as pool:
+			parts = list(pool.map(send, range(len(offsets))))
+		client.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts})
+	except Exception:
+		client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+		raise
+	stats = TransferStats("upload", key, size, time.perf_counter() - started, workers, len(offsets))
+	stats.log()
+	return stats
+
+###############################################################################
+
+def _timed(fn) -> float:
+	started = time.perf_counter()
+	fn()
+	return time.perf_counter() - started
+
+
+def benchmark(client, bucket: str, size_mb: int, stream_counts: list[int]) -> list[dict]:
+	"""Upload and download one random object per configuration; MB/s each way."""
+	results = []
+	work_dir = tempfile.mkdtemp(prefix="transfer-bench-")
+	try:
+		src = os.path.join(work_dir, "src.bin")
+		dst = os.path.join(work_dir, "dst.bin")
+		with open(src, "wb") as f:
+			for _ in range(size_mb):
+				f.write(os.urandom(MB))
+		size = size_mb * MB
+		key = f"transfer-bench/{size_mb}mb.bin"
+
+		# boto3's managed transfers with their default TransferConfig
+		up = _timed(lambda: client.upload_file(Filename=src, Bucket=bucket, Key=key))
+		down = _timed(lambda: client.download_file(Bucket=bucket, Key=key, Filename=dst))
+		results.append({"path": "boto3 default", "uploadMBps": round(size / MB / up, 1), "downloadMBps": round(size / MB / down, 1)})
+
+		down = stream_download(client, bucket, key, dst).seconds
+		results.append({"path": "stream fallback", "downloadMBps": round(size / MB / down, 1)})
+
+		for streams in stream_counts:
+			up = upload(client, bucket, key, src, streams=streams).seconds
+			down = download(client, bucket, key, dst, streams=streams).seconds
+			if os.path.getsize(dst) != size:
+				raise RuntimeError(f"Downloaded {os.path.getsize(dst)} bytes, expected {size}")
+			results.append({"path": f"transfer x{streams}", "uploadMBps": round(size / MB / up, 1), "downloadMBps": round(size / MB / down, 1)})
+		client.delete_object(Bucket=bucket, Key=key)
+	finally:
+		shutil.rmtree(work_dir, ignore_errors=True)
+	return results
+
+###############################################################################
+
+def main(argv: list[str]) -> int:
+	parser = argparse.ArgumentParser(description="S3 transfer benchmark")
+	sub = parser.add_subparsers(dest="command", required=True)
+	bench = sub.add_parser("benchmark", help="compare transfer paths against an S3 endpoint")
+	bench.add_argument("--endpoint-url", help="S3-compatible endpoint, e.g. http://localhost:9000")
+	bench.add_argument("--bucket", required=True)
+	bench.add_argument("--size-mb", type=int, default=256)
+	bench.add_argument("--streams", default=f"1,4,{STREAMS}", help="comma-separated stream counts")
+	args = parser.parse_args(argv)
+
+	import boto3
+	from botocore.config import Config
+	import runtime
+	client = boto3.client("s3", endpoint_url=args.endpoint_url, config=Config(**runtime.CLIENT_CONFIG))
+	try:
+		client.head_bucket(Bucket=args.bucket)
+	except Exception:
+		client.create_bucket(Bucket=args.bucket)
+	results = benchmark(client, args.bucket, args.size_mb, [int(s) for s in args.streams.split(",")])
+	print(json.dumps({"sizeMB": args.size_mb, "results": results}, indent=2))
+	return 0
+
+###############################################################################
+
+if __name__ == "__main__":
+	logging.basicConfig(level=logging.WARNING)
+	sys.exit(main(sys.argv[1:]))